@@ -0,0 +1,120 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from main import main
+
+# Runs every job of a manifest through main in a process pool
+# Usage: python batch.py jobs.csv -j 4 -o results.csv --reports
+
+# A manifest is a CSV file with a header row naming the main parameters, one video per line
+# startFrame is optional and defaults to keyFrame, lines starting with # are skipped
+JOB_COLUMNS = ["filename","outputName","keyFrame","startFrame","lastFrame","tempo","key","title","composer","noteThreshold"]
+RESULT_COLUMNS = ["filename","outputName","errorMessage","tempo","seconds","frames","framesPerSecond"]
+
+# Converts a manifest field to an int, or a float if it has a fraction
+def Number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+# Reads the job manifest at manifestPath, returns a list of dicts with the main parameters of each job
+def ReadJobs(manifestPath):
+    jobs = []
+    with open(manifestPath, newline="") as manifest:
+        for row in csv.DictReader(line for line in manifest if not line.startswith("#")):
+            if not row.get("startFrame"):
+                row["startFrame"] = row["keyFrame"]
+            missing = [column for column in JOB_COLUMNS if not row.get(column)]
+            if missing:
+                raise ValueError("Job "+str(len(jobs)+1)+" is missing "+", ".join(missing))
+            job = {column: row[column] for column in JOB_COLUMNS}
+            for column in ["keyFrame","startFrame","lastFrame","tempo","key","noteThreshold"]:
+                job[column] = Number(job[column])
+            jobs.append(job)
+    return jobs
+
+# Runs one job in a pool worker, returns its result row
+# frames counts the frames decoded after calibration (frames whose detection was skipped included)
+# writeReport writes the stage timings and counters of main(report=True) to outputName.report.json
+def RunJob(job, options, writeReport=False):
+    outputFolder = os.path.dirname(job["outputName"])
+    if outputFolder:
+        os.makedirs(outputFolder, exist_ok=True)
+
+    startTime = time.perf_counter()
+    errorMessage, tempo, report = main(*[job[column] for column in JOB_COLUMNS], report=True, **options)
+    seconds = time.perf_counter() - startTime
+    if writeReport:
+        with open(job["outputName"]+".report.json", "w") as output:
+            json.dump(report, output, indent=2)
+
+    frames = report["counters"].get("framesDecoded", 0)
+    return {"filename": job["filename"], "outputName": job["outputName"], "errorMessage": errorMessage, "tempo": tempo,
+            "seconds": round(seconds, 3), "frames": frames, "framesPerSecond": round(frames/seconds, 1) if seconds>0 else 0}
+
+# Runs job in a pool of its own, so a worker that dies only breaks this job's pool
+def RunAlone(job, options, writeReport=False):
+    with concurrent.futures.ProcessPoolExecutor(1) as executor:
+        return executor.submit(RunJob, job, options, writeReport).result()
+
+# Stores the result row of a finished future of jobs[index] in results and prints it
+def FinishJob(results, jobs, index, future):
+    job = jobs[index]
+    try:
+        result = future.result()
+    except Exception as error:
+        result = {"filename": job["filename"], "outputName": job["outputName"], "errorMessage": repr(error),
+                  "tempo": job["tempo"], "seconds": None, "frames": None, "framesPerSecond": None}
+    results[index] = result
+    print(result["filename"], "FAILED "+result["errorMessage"] if result["errorMessage"] else "OK",
+          result["seconds"], "s", result["framesPerSecond"], "frames/s")
+
+# Runs jobs on a pool of parallelism processes, options are passed on to process (threads, ...)
+# A job that fails gets its errorMessage and the rest of the batch keeps running
+# A worker that dies breaks the pool and fails every job left in it, those jobs are run again each in its own pool
+# (parallelism at once) so only the job whose worker died keeps the error
+# writeReports writes the report of each job next to its score, see RunJob
+# Returns the result rows in the order of jobs
+def RunBatch(jobs, parallelism, options={}, writeReports=False):
+    results = [None]*len(jobs)
+    broken = [] # Indices of the jobs failed by a broken pool
+    with concurrent.futures.ProcessPoolExecutor(parallelism) as executor:
+        futures = {executor.submit(RunJob, job, options, writeReports): index for index, job in enumerate(jobs)}
+        for future in concurrent.futures.as_completed(futures):
+            if isinstance(future.exception(), BrokenProcessPool):
+                broken.append(futures[future])
+            else:
+                FinishJob(results, jobs, futures[future], future)
+    if broken:
+        print(len(broken), "jobs lost to a worker that died, running them again one per process")
+        with concurrent.futures.ThreadPoolExecutor(parallelism) as executor:
+            futures = {executor.submit(RunAlone, jobs[index], options, writeReports): index for index in broken}
+            for future in concurrent.futures.as_completed(futures):
+                FinishJob(results, jobs, futures[future], future)
+    return results
+
+# Writes the result rows to a CSV file
+def WriteResults(resultsPath, results):
+    with open(resultsPath, "w", newline="") as output:
+        writer = csv.DictWriter(output, RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translates every video of a job manifest")
+    parser.add_argument("manifest", help="CSV job manifest")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Videos translated at once")
+    parser.add_argument("-o", "--output", default="results.csv", help="CSV file for the per-job results")
+    parser.add_argument("--threads", type=int, default=0, help="Detection threads per video, see process")
+    parser.add_argument("--reports", action="store_true", help="Writes stage timings and counters to outputName.report.json")
+    arguments = parser.parse_args()
+
+    results = RunBatch(ReadJobs(arguments.manifest), arguments.jobs, {"threads": arguments.threads}, arguments.reports)
+    WriteResults(arguments.output, results)
+    failed = sum(1 for result in results if result["errorMessage"])
+    print(len(results)-failed, "of", len(results), "jobs translated, results in", arguments.output)
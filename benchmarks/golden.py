@@ -0,0 +1,211 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import sys
+import tracemalloc
+import xml.etree.ElementTree as ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import (BeatTranslation, CreateXmlEnd, CreateXmlIntro, CreateXmlMeasures, Instrumentation, MeasureLength,
+                  NoteTranslation, SortBeats, SplitHands)
+
+# Replays the scores in "MusicXML Translations" through the back half of main.py and checks the result
+# Each score is read back into notes, turned into a noteList and run through NoteTranslation, SplitHands (with
+# SortBeats), BeatTranslation and CreateXmlMeasures, then the new score is read back and compared note for note
+# Scaled runs repeat the piece end to end (10 times, 100 times, ...) to show stages that don't scale linearly
+# Usage: python benchmarks/golden.py --scales 1 10 100
+
+GOLDEN_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MusicXML Translations")
+STEP_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11} # Semitones above C
+REPLAY_TEMPO = 120 # Any tempo works, replayed notes sit exactly on its sixteenth note grid
+STAGES = ("translate", "split", "beats", "xml")
+TIME_SIGNATURES = ((2, 4), (3, 4), (4, 4), (5, 4), (2, 2), (6, 8), (7, 8), (9, 8), (12, 8))
+
+# Reads a score written by CreateScore from source (path or file object)
+# Returns (attributes, notes, measureCount), attributes are the divisions, fifths, beats and beat-type of measure 1
+# notes are sorted (staff, noteIndex, start, length) tuples in quarter notes from the start of the score,
+# notes tied across entries are joined and rests are left out
+def ReadScore(source):
+    root = ElementTree.parse(source).getroot()
+    attributes = {name: int(root.find(".//attributes//"+name).text) for name in ("divisions", "fifths", "beats", "beat-type")}
+    divisions = attributes["divisions"]
+    measureLength = MeasureLength((attributes["beats"], attributes["beat-type"]))
+    measures = root.findall("./part/measure")
+
+    notes = []
+    tied = {} # (staff, noteIndex) -> indices in notes of the notes tied into a later entry
+    for measureNum, measure in enumerate(measures):
+        cursor, lastStart = 0, 0 # In divisions from the start of the measure
+        for element in measure:
+            if element.tag == "backup":
+                cursor -= int(element.findtext("duration"))
+                continue
+            if element.tag != "note":
+                continue
+            duration = int(element.findtext("duration"))
+            if element.find("chord") is not None: # Starts with the entry before it
+                start = lastStart
+            else:
+                start = cursor
+                cursor += duration
+            lastStart = start
+            pitch = element.find("pitch")
+            if pitch is None: # Rest
+                continue
+
+            noteIndex = (12*int(pitch.findtext("octave")) - 9 + STEP_SEMITONES[pitch.findtext("step")] +
+                         int(pitch.findtext("alter") or 0))
+            staff = int(element.findtext("staff"))
+            ties = {tie.get("type") for tie in element.iter("tied")}
+            start = measureNum*measureLength + start/divisions
+            openTies = tied.setdefault((staff, noteIndex), [])
+            # The same key can be held twice in different voices, a tie continues the note that ends where it starts
+            index = next((index for index in openTies if notes[index][2]+notes[index][3] == start), None)
+            if "stop" in ties and index is not None:
+                openTies.remove(index)
+                notes[index] = notes[index][:3] + (notes[index][3] + duration/divisions,)
+            else:
+                index = len(notes)
+                notes.append((staff, noteIndex, start, duration/divisions))
+            if "start" in ties:
+                openTies.append(index)
+    return attributes, sorted(notes), len(measures)
+
+# Returns the notes of ReadScore as a noteList played at REPLAY_TEMPO, copies times one after the other
+def ReplayNotes(notes, measureCount, measureLength, copies=1):
+    quarterLength = 60000/REPLAY_TEMPO
+    noteList = []
+    for copy in range(copies):
+        offset = copy*measureCount*measureLength
+        for _, noteIndex, start, length in notes:
+            noteList.append([noteIndex, (start+offset)*quarterLength, (start+offset+length)*quarterLength])
+    noteList.sort(key=lambda note: note[2]) # In order of release like process
+    return noteList
+
+# Returns the notes ReadScore should find in a score of copies of notes
+def ScaledNotes(notes, measureCount, measureLength, copies):
+    return sorted((staff, noteIndex, start + copy*measureCount*measureLength, length)
+                  for copy in range(copies) for staff, noteIndex, start, length in notes)
+
+# Runs noteList through the back end stages, writing the score to output
+# instruments times the stages, trace gets the peak traced memory (bytes) of each stage above what it started with
+def ReplayStages(noteList, output, sharpIndex, timeSig, measureCount, title, composer, instruments, trace=None):
+    def Run(stage, function, *arguments):
+        if trace is not None:
+            tracemalloc.reset_peak()
+            startMemory = tracemalloc.get_traced_memory()[0]
+        with instruments.Stage(stage):
+            result = function(*arguments)
+        if trace is not None:
+            trace[stage] = tracemalloc.get_traced_memory()[1] - startMemory
+        return result
+
+    beatList = Run("translate", NoteTranslation, noteList, 60000/REPLAY_TEMPO, 0)
+    leftHand, rightHand = Run("split", lambda: tuple(SortBeats(hand) for hand in SplitHands(beatList)))
+    leftMeasures, rightMeasures = Run("beats", lambda: (BeatTranslation(leftHand, timeSig, measureCount, 1),
+                                                        BeatTranslation(rightHand, timeSig, measureCount, 1)))
+    CreateXmlIntro(output, title, composer)
+    Run("xml", CreateXmlMeasures, output, leftMeasures, rightMeasures, sharpIndex, timeSig)
+    CreateXmlEnd(output)
+
+# Replays the score at path scaled copies times
+# Returns a dict with the note and measure counts, match (notes, measure count and attributes read back from the new
+# score are the ones expected), identical (same text as the golden score, only checked unscaled), and per stage
+# seconds, notes per second and peak memory (MB, the xml stage includes the score text it writes to memory)
+def RunGolden(path, copies=1):
+    attributes, notes, measureCount = ReadScore(path)
+    root = ElementTree.parse(path).getroot()
+    title, composer = root.findtext("movement-title"), root.findtext(".//creator")
+    timeSig = (attributes["beats"], attributes["beat-type"])
+    measureLength = MeasureLength(timeSig)
+    noteList = ReplayNotes(notes, measureCount, measureLength, copies)
+
+    instruments = Instrumentation()
+    output = io.StringIO()
+    peaks = {}
+    with contextlib.redirect_stdout(io.StringIO()): # NoteTranslation prints the tempo
+        ReplayStages(noteList, output, attributes["fifths"], timeSig, measureCount*copies, title, composer, instruments)
+        tracemalloc.start() # Traced separately, tracing slows the stages down
+        try:
+            ReplayStages(noteList, io.StringIO(), attributes["fifths"], timeSig, measureCount*copies, title, composer,
+                         Instrumentation(enabled=False), peaks)
+        finally:
+            tracemalloc.stop()
+    peaks["total"] = max(peaks.values())
+
+    score = output.getvalue()
+    output.seek(0)
+    newAttributes, newNotes, newMeasureCount = ReadScore(output)
+    seconds = {stage: instruments.seconds[stage] for stage in STAGES}
+    seconds["total"] = sum(seconds.values())
+    report = {"score": os.path.basename(path), "copies": copies, "notes": len(noteList),
+              "measures": measureCount*copies, "xmlBytes": len(score.encode("utf-8")),
+              "match": (newAttributes == attributes and newMeasureCount == measureCount*copies and
+                        newNotes == ScaledNotes(notes, measureCount, measureLength, copies)),
+              "identical": None,
+              "seconds": {stage: round(value, 4) for stage, value in seconds.items()},
+              "notesPerSecond": {stage: round(len(noteList)/value) if value>0 else None for stage, value in seconds.items()},
+              "peakMB": {stage: round(value/2**20, 2) for stage, value in peaks.items()}}
+    if copies == 1:
+        with open(path, encoding="utf-8") as golden:
+            report["identical"] = golden.read() == score
+    return report
+
+# Writes random notes in each of timeSigs through the same stages and reads them back
+# Each hand holds one note through three measures or more, so measures that are no single note value get split
+# into tied notes in every measure the note runs through
+# Returns a list of dicts with the time signature and match (the notes and measure count read back are the ones written)
+def RoundTripTimeSignatures(timeSigs=TIME_SIGNATURES, seed=0, measureCount=12):
+    rng = random.Random(seed)
+    reports = []
+    for timeSig in timeSigs:
+        measureLength = MeasureLength(timeSig)
+        notes = [(1, 52, 0.25, 3*measureLength + 0.5), (2, 20, measureLength - 0.75, 3*measureLength)]
+        keyFree = {52: notes[0][2]+notes[0][3], 20: notes[1][2]+notes[1][3]} # Keys are pressed again once released
+        for step in range(int(measureCount*measureLength*4)):
+            start = step/4
+            key = rng.randrange(88)
+            length = rng.choice((0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5))
+            if rng.random() < 0.4 and keyFree.get(key, 0) <= start and start+length <= measureCount*measureLength:
+                notes.append((1 if key>=39 else 2, key, start, length))
+                keyFree[key] = start + length
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()): # NoteTranslation prints the tempo
+            ReplayStages(ReplayNotes(notes, measureCount, measureLength), output, 0, timeSig, measureCount,
+                         "Round trip", "golden.py", Instrumentation(enabled=False))
+        output.seek(0)
+        attributes, newNotes, newMeasureCount = ReadScore(output)
+        reports.append({"timeSignature": str(timeSig[0])+"/"+str(timeSig[1]), "notes": len(notes),
+                        "match": ((attributes["beats"], attributes["beat-type"]) == timeSig and
+                                  newMeasureCount == measureCount and newNotes == sorted(notes))})
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays the golden MusicXML scores through the score back end")
+    parser.add_argument("--folder", default=GOLDEN_FOLDER, help="Folder of .musicxml scores written by main.py")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Copies of each piece replayed")
+    parser.add_argument("--json", default=None, help="Also writes the reports to this JSON file")
+    arguments = parser.parse_args()
+
+    reports = RoundTripTimeSignatures()
+    for report in reports:
+        print(("round trip "+report["timeSignature"]).ljust(34), str(report["notes"]).rjust(14), "notes",
+              "OK" if report["match"] else "DIFF")
+    for path in sorted(glob.glob(os.path.join(arguments.folder, "*.musicxml"))):
+        for copies in arguments.scales:
+            report = RunGolden(path, copies)
+            reports.append(report)
+            print(report["score"].ljust(34), str(copies).rjust(4)+"x", str(report["notes"]).rjust(8), "notes",
+                  "OK  " if report["match"] else "DIFF", " ".join(stage+" "+str(report["notesPerSecond"][stage])+"/s "+
+                  str(report["peakMB"].get(stage, ""))+"MB" for stage in STAGES + ("total",)))
+    failed = [report for report in reports if not report["match"]]
+    print(len(reports)-len(failed), "of", len(reports), "replays match their golden or written score")
+    if arguments.json:
+        with open(arguments.json, "w") as output:
+            json.dump(reports, output, indent=2)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import Instrumentation, LoadIntensities, NotesFromIntensities, process
+
+# Renders a Synthesia style video from a known note list and runs it through process
+# Reports frames per second of each stage (see Instrumentation) and note precision/recall against the note list
+# Usage: python benchmarks/synthetic.py --width 1280 --height 720 --fps 30 --length 30 --tempo 120 --density 6
+
+BLACK_KEYS = (1, 4, 6, 9, 11) # Key index % 12 of the black keys, key 0 is A0
+RIGHT_HAND_KEY = 39 # Keys from middle C up are drawn in the right hand color, like SplitHands
+
+# Returns [left, right] pixel columns of the 88 keys of a keyboard width pixels wide
+# White keys split the width evenly, black keys are half as wide and centered on the edge of the white key before them
+def KeyboardLayout(width):
+    whiteKeys = [key for key in range(88) if key%12 not in BLACK_KEYS]
+    whiteWidth = width/len(whiteKeys)
+    columns = [None]*88
+    for i, key in enumerate(whiteKeys):
+        columns[key] = (int(round(i*whiteWidth)), int(round((i+1)*whiteWidth))-1)
+    for key in range(88):
+        if key%12 in BLACK_KEYS:
+            edge = columns[key-1][1]+1
+            columns[key] = (int(round(edge-whiteWidth/4)), int(round(edge+whiteWidth/4))-1)
+    return columns
+
+# Random notes on a sixteenth note grid of tempo, density is the average number of notes started per second
+# Notes cover all 88 keys, a key is only pressed again releaseGap ms after its last note ended
+# Returns (key, start, end) tuples sorted by start, times in ms
+def RandomNotes(length, tempo=120, density=6, seed=0, firstNote=1000, releaseGap=100):
+    rng = np.random.default_rng(seed)
+    sixteenth = 60000/tempo/4
+    keyFree = np.zeros(88)
+    notes = []
+    for step in range(int((length-firstNote)/sixteenth)):
+        start = firstNote + step*sixteenth
+        for key in rng.integers(0, 88, rng.poisson(density*sixteenth/1000)):
+            end = start + sixteenth*rng.choice((1, 2, 2, 4, 4, 8))
+            if keyFree[key] <= start and end <= length:
+                notes.append((int(key), start, end))
+                keyFree[key] = end + releaseGap
+    return notes
+
+# Renders notes to an mp4 video at path, notes are (key, start, end) with times in ms
+# Bars fall from the top of the frame to the keyboard in fallTime ms and reach it at the start of their note,
+# keys are lit while their note plays
+# glare - Brightness added at the center of a spot drifting across the falling bars, as a fraction of white (0 for none)
+# particles - Sparks drawn above the keyboard for each note playing in a frame, like Synthesia's particle effects
+def RenderVideo(path, notes, width=1280, height=720, fps=30, length=10000, fallTime=2000, glare=0, particles=0, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = KeyboardLayout(width)
+    keyboardTop = height - height//5
+    blackBottom = keyboardTop + int((height-keyboardTop)*0.62)
+    speed = keyboardTop/fallTime # Pixels per ms
+
+    background = np.full((height, width, 3), 25, np.uint8)
+    background[keyboardTop:] = 235
+    for key in range(88):
+        if key%12 not in BLACK_KEYS:
+            background[keyboardTop:, columns[key][0]:columns[key][0]+2] = 10 # Darker than the black keys
+    for key in range(88):
+        if key%12 in BLACK_KEYS:
+            background[keyboardTop:blackBottom, columns[key][0]:columns[key][1]+1] = 20
+    if glare > 0:
+        y, x = np.mgrid[0:keyboardTop, 0:2*width]
+        glareMask = glare*255*np.exp(-(((x-width)/(width/6))**2 + ((y-keyboardTop/2)/(keyboardTop/4))**2))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise Exception("Video writer could not open "+path)
+    keys = np.array([note[0] for note in notes], dtype=int)
+    starts = np.array([note[1] for note in notes], dtype=float)
+    ends = np.array([note[2] for note in notes], dtype=float)
+    try:
+        for i in range(int(length*fps/1000)):
+            timestamp = i*1000/fps
+            frame = background.copy()
+            visible = np.flatnonzero((starts <= timestamp + fallTime) & (ends >= timestamp))
+            for note in visible.tolist():
+                key = keys[note]
+                bottom = keyboardTop + (timestamp-starts[note])*speed
+                top = keyboardTop + (timestamp-ends[note])*speed
+                color = (60, 200, 240) if key >= RIGHT_HAND_KEY else (240, 160, 60)
+                left, right = columns[key]
+                cv2.rectangle(frame, (left+1, int(max(0, top))), (right-1, int(min(keyboardTop-1, bottom))), color, -1)
+                if starts[note] <= timestamp: # Playing, lights the key and throws sparks
+                    litTop = keyboardTop if key%12 in BLACK_KEYS else blackBottom
+                    litBottom = blackBottom if key%12 in BLACK_KEYS else height
+                    frame[litTop:litBottom, left+2:right-1] = color
+                    for _ in range(particles):
+                        y = keyboardTop - int(rng.integers(2, 40))
+                        x = int(rng.integers(left-6, right+7))
+                        frame[y:y+3, max(0, x):x+3] = 255
+            if glare > 0:
+                offset = int(width*(0.5 + 0.5*np.sin(2*np.pi*timestamp/length)))
+                lit = frame[:keyboardTop].astype(np.float32) + glareMask[:, offset:offset+width, None]
+                frame[:keyboardTop] = np.clip(lit, 0, 255).astype(np.uint8)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+# Matches detected notes to the ground truth notes of the same key whose start is within tolerance ms
+# Detection reads the bars above the keyboard, so detected times are shifted by a global offset first,
+# offset is the median start difference of the nearest notes of each key unless given
+# Returns a dict with precision, recall, the offset and the mean start and end error of matched notes
+def ScoreNotes(detected, truth, tolerance=50, offset=None):
+    detected = sorted((int(note[0]), float(note[1]), float(note[2])) for note in detected)
+    truth = sorted((int(note[0]), float(note[1]), float(note[2])) for note in truth)
+    truthByKey = [[] for _ in range(88)]
+    for key, start, end in truth:
+        truthByKey[key].append((start, end))
+
+    if offset is None:
+        differences = []
+        for key, start, _ in detected:
+            truthStarts = np.array([note[0] for note in truthByKey[key]])
+            if len(truthStarts):
+                differences.append(truthStarts[np.argmin(np.abs(truthStarts-start))] - start)
+        offset = float(np.median(differences)) if differences else 0.0
+
+    matched, startErrors, endErrors = 0, [], []
+    used = set()
+    for key, start, end in detected:
+        best = None
+        for index, (truthStart, truthEnd) in enumerate(truthByKey[key]):
+            error = abs(truthStart - (start+offset))
+            if error <= tolerance and (key, index) not in used and (best is None or error < best[0]):
+                best = (error, index, truthEnd)
+        if best is not None:
+            used.add((key, best[1]))
+            matched += 1
+            startErrors.append(best[0])
+            endErrors.append(abs(best[2] - (end+offset)))
+    return {"precision": matched/len(detected) if detected else 0.0, "recall": matched/len(truth) if truth else 0.0,
+            "offset": round(offset, 1), "startError": round(float(np.mean(startErrors)), 1) if matched else None,
+            "endError": round(float(np.mean(endErrors)), 1) if matched else None,
+            "detected": len(detected), "truth": len(truth), "matched": matched}
+
+# Renders one synthetic video into folder and runs it through process with an Instrumentation
+# Stages are render plus the stages of the Instrumentation report, total is process from key frame to score
+# (recording the key intensities the detected notes are read back from)
+# options are passed on to process (threads, frameSource, ...)
+# Returns the report dict, frames per second of each stage counts the video frames
+def RunBenchmark(folder, width=1280, height=720, fps=30, length=30000, tempo=120, density=6, glare=0, particles=0,
+                 seed=0, noteThreshold=50, options={}):
+    videoPath = os.path.join(folder, "synthetic.mp4")
+    outputName = os.path.join(folder, "synthetic")
+    intensityFile = os.path.join(folder, "synthetic_intensities.npy")
+    notes = RandomNotes(length, tempo, density, seed)
+
+    startTime = time.perf_counter()
+    RenderVideo(videoPath, notes, width, height, fps, length, glare=glare, particles=particles, seed=seed)
+    seconds = {"render": time.perf_counter() - startTime}
+
+    instruments = Instrumentation()
+    with instruments.Stage("total"):
+        process(videoPath, outputName, 0, 0, length, tempo, 0, "Synthetic", "Benchmark", noteThreshold,
+                intensityFile=intensityFile, instruments=instruments, **options)
+    timings = instruments.Report()
+    for stage, timing in timings["stages"].items():
+        seconds[stage] = timing["seconds"]
+    frames = int(length*fps/1000)
+    scoreSeconds = sum(seconds.get(stage, 0) for stage in ("translate", "measures", "xml"))
+
+    detected, _ = NotesFromIntensities(LoadIntensities(intensityFile), noteThreshold)
+    report = {"width": width, "height": height, "fps": fps, "length": length, "tempo": tempo, "density": density,
+              "glare": glare, "particles": particles, "frames": frames,
+              "framesPerSecond": {stage: round(frames/value, 1) if value>0 else None for stage, value in seconds.items()},
+              "seconds": {stage: round(value, 3) for stage, value in seconds.items()},
+              "scoreNotesPerSecond": round(len(detected)/scoreSeconds, 1) if scoreSeconds>0 else None,
+              "counters": timings["counters"]}
+    report.update(ScoreNotes(detected, notes, tolerance=max(50, 1500/fps)))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks process on a rendered Synthesia style video")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--length", type=float, default=30, help="Video length in seconds")
+    parser.add_argument("--tempo", type=float, default=120, help="Tempo of the note grid in BPM")
+    parser.add_argument("--density", type=float, default=6, help="Notes started per second")
+    parser.add_argument("--glare", type=float, default=0, help="Glare brightness from 0 to 1, see RenderVideo")
+    parser.add_argument("--particles", type=int, default=0, help="Sparks per playing note per frame")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--note-threshold", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=0, help="Detection threads, see process")
+    parser.add_argument("--frame-source", default="capture", help="capture or ffmpeg, see process")
+    parser.add_argument("--folder", default=None, help="Keeps the video and score in this folder")
+    parser.add_argument("--json", default=None, help="Also writes the report to this JSON file")
+    arguments = parser.parse_args()
+
+    options = {"threads": arguments.threads, "frameSource": arguments.frame_source}
+    with tempfile.TemporaryDirectory() as temporaryFolder:
+        folder = arguments.folder or temporaryFolder
+        os.makedirs(folder, exist_ok=True)
+        report = RunBenchmark(folder, arguments.width, arguments.height, arguments.fps, int(arguments.length*1000),
+                              arguments.tempo, arguments.density, arguments.glare, arguments.particles, arguments.seed,
+                              arguments.note_threshold, options)
+
+    for stage, framesPerSecond in report["framesPerSecond"].items():
+        print(stage.ljust(10), str(framesPerSecond).rjust(10), "frames/s", str(report["seconds"][stage]).rjust(8), "s")
+    print("score".ljust(10), str(report["scoreNotesPerSecond"]).rjust(10), "notes/s (translate, measures, xml)")
+    print("precision", round(report["precision"], 4), "recall", round(report["recall"], 4),
+          "matched", report["matched"], "of", report["truth"], "detected", report["detected"], "offset", report["offset"], "ms")
+    if arguments.json:
+        with open(arguments.json, "w") as output:
+            json.dump(report, output, indent=2)
@@ -1,7 +1,23 @@
 from logging import raiseExceptions
+import concurrent.futures
+import contextlib
+import cProfile
+import functools
+import hashlib
+import heapq
+import io
+import json
 import os
+import pstats
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
 import cv2
 import math
+import numpy as np
 
 # Keyboard with poor lighting, glare, poor angle, or always covered by pianist hands cannot be processed
 # Assumes all 88 keys of the keyboard are shown and fill a region of the screen from left to right
@@ -11,67 +27,804 @@ import math
 # Thick falling bars or bars with shine effect can be read as multiple notes
 # Pieces with varying tempo cannot be accurately classified under a single tempo
 
-# Creates [left, right] bounds for 88 keys by iterating through pixels in keyRow
+# Finds the light/dark segments of keyRow at every threshold in keyThresholds at once
+# A segment starts at each change from light to dark or dark to light (the row starts dark)
+# Returns (thresholdIndex, start, next start) for the segments at least keyLength wide
+def KeySegments(row, width, keyThresholds, keyLength):
+    light = np.asarray(row)[:width] >= np.asarray(keyThresholds).reshape(-1,1)
+    bounds = np.ones((light.shape[0], width+1), dtype=bool) # Segment starts, plus width as the end of the last segment
+    bounds[:,1:width] = light[:,1:] != light[:,:-1]
+    thresholdIndex, position = np.nonzero(bounds)
+
+    starts, nextStarts = position[:-1], position[1:]
+    kept = (thresholdIndex[:-1]==thresholdIndex[1:]) & (nextStarts-starts>=keyLength)
+    return (thresholdIndex[:-1][kept], starts[kept], nextStarts[kept])
+
+# Creates [left, right] bounds for 88 keys from the light/dark segments of keyRow
 # keyThreshold - Intensity of pixel to differentiate between black/white, default 75
 # keyLength - Minimum width required for key, default 3
 def CreateKeyGroups(row, width, keyThreshold, keyLength):
-    dark = True # True if last pixel was black
-    keyGroups = [[0]] # Bounds for keys
-    for i in range(len(row)):
-        # Row changes from light to dark or dark to light
-        if (dark and row[i]>=keyThreshold) or (not dark and row[i]<keyThreshold):
-            if (i-keyGroups[-1][0]<keyLength):
-                keyGroups.pop()
-            else:
-                keyGroups[-1].append(i-1)
-            keyGroups.append([i])
-            dark = not dark
-    if(width-keyGroups[-1][0]<keyLength):
-        keyGroups.pop()
-    else:
-        keyGroups[-1].append(width)
+    _, starts, nextStarts = KeySegments(row, width, [keyThreshold], keyLength)
+    ends = np.where(nextStarts==width, width, nextStarts-1) # Last key runs to the edge of the frame
+    return np.stack((starts, ends), axis=1).tolist()
+
+# Counts keyGroups that CreateKeyGroups would find for each threshold in keyThresholds
+def CountKeyGroups(row, width, keyThresholds, keyLength):
+    thresholdIndex, _, _ = KeySegments(row, width, keyThresholds, keyLength)
+    return np.bincount(thresholdIndex, minlength=len(keyThresholds))
+
+# Splits keyGroups read as 73 keys (E-F and B-C read as one key) into 88 keys
+# Returns keyGroups unchanged if the groups do not look like a keyboard
+def SplitKeyGroups(keyGroups):
+    keyGaps = []
+    for group in keyGroups:
+        keyGaps.append(group[1]-group[0])
+    if (0.5 * keyGaps[0] <= keyGaps[1]) and (keyGaps[1] <= 1.5 *keyGaps[0]):
+        comboIndexes = [2,6,12,16,22,26,32,36,42,46,52,56,62,66,72]
+        comboRanges=[]
+        for comboIndex in comboIndexes[::-1]:
+            if math.floor(1.5*(keyGroups[0][1]-keyGroups[0][0])) <= (keyGroups[comboIndex][1]-keyGroups[comboIndex][0]):
+                comboLength = (keyGroups[comboIndex][1]-keyGroups[comboIndex][0])//2
+                comboRanges.append([keyGroups[comboIndex][0],keyGroups[comboIndex][0]+comboLength])
+                comboRanges.append([keyGroups[comboIndex][1]-comboLength,keyGroups[comboIndex][1]])
+                keyGroups.pop(comboIndex)
+
+        keyGroups.extend(comboRanges)
+        keyGroups.sort(key=lambda x:x[0])
+
+        print("EXTENDED TO"+str(len(keyGroups)))
     return keyGroups
 
+# Searches rows from the bottom of the key frame for a row and threshold that read as 88 keys
+# Each row is thresholded at all thresholds at once, only candidates with 73 or 88 groups are built
+# frame, debug - Optional color key frame and DebugWriter, saves debug images of every candidate with 50 or more groups
+# instruments - Optional Instrumentation, counts the rows tested (calibrationRows) and candidates built (calibrationAttempts)
+# Returns (keyGroups, keyRow, keyThreshold)
+def FindKeyboard(frameBW, keyLength, frame=None, debug=None, instruments=None):
+    if instruments is None:
+        instruments = NO_INSTRUMENTS
+    height, width = frameBW.shape[:2]
+    keyThresholds = np.arange(5, 300, 5) # 5, 10, ..., 295
+    if debug is None or not debug.enabled:
+        frame = None
+    minCount = 50 if frame is not None else 73
+
+    # Testing row which keyboard can be read
+    for i in range(1,height//20):
+        keyRow = height - 20*i
+        counts = CountKeyGroups(frameBW[keyRow], width, keyThresholds, keyLength)
+        instruments.Count("calibrationRows")
+
+        for j in np.flatnonzero(counts>=minCount):
+            keyThreshold = int(keyThresholds[j])
+            if frame is None and counts[j] not in (73, 88):
+                continue
+            keyGroups = CreateKeyGroups(frameBW[keyRow], width, keyThreshold, keyLength)
+            instruments.Count("calibrationAttempts")
+
+            if frame is not None:
+                DrawKeyGroups(frame,keyGroups,height,keyThreshold,keyRow,debug)
+                debug.Save("Frames/"+str(len(keyGroups))+" "+str(keyRow)+" "+str(keyThreshold)+".png", frame.copy())
+
+            if len(keyGroups)==73: # 73 is the length when E-F and B-C read as one key
+                keyGroups = SplitKeyGroups(keyGroups)
+
+            if len(keyGroups)==88:
+                if frame is not None:
+                    DrawKeyGroups(frame,keyGroups,height,keyThreshold,keyRow,debug)
+                    debug.Save("Frames/__"+str(len(keyGroups))+" "+str(keyRow)+" "+str(keyThreshold)+".png", frame.copy())
+                return (keyGroups, keyRow, keyThreshold)
+
+    raise Exception("Keyboard cannot be read")
+
+# Cheap fingerprint of a video used as the calibration cache key
+# Combines file size, resolution, fps, keyLength and a hash of the grayscale key frame
+def VideoFingerprint(filename, cap, frameBW, keyLength):
+    height, width = frameBW.shape[:2]
+    frameHash = hashlib.sha1(np.ascontiguousarray(frameBW).tobytes()).hexdigest()
+    fps = round(cap.get(cv2.CAP_PROP_FPS), 3)
+    return " ".join([str(os.path.getsize(filename)), str(width)+"x"+str(height), str(fps), str(keyLength), frameHash])
+
+# A missing or corrupt cache reads as empty, so every lookup is a miss
+def ReadCalibrationCache(cachePath):
+    if not os.path.isfile(cachePath):
+        return {}
+    try:
+        with open(cachePath) as cacheFile:
+            cache = json.load(cacheFile)
+    except ValueError:
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+# Writes the cache to a temporary file first so readers never see a half written cache
+# Each writer gets its own temporary file, processes sharing the cache replace it in turn (the last write wins)
+def WriteCalibrationCache(cachePath, cache):
+    handle, temporaryPath = tempfile.mkstemp(prefix=os.path.basename(cachePath)+".", suffix=".tmp",
+                                             dir=os.path.dirname(os.path.abspath(cachePath)))
+    try:
+        with os.fdopen(handle, "w") as cacheFile:
+            json.dump(cache, cacheFile)
+        os.replace(temporaryPath, cachePath)
+    except BaseException:
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+        raise
+
+# Returns cached calibration {"keyGroups", "keyRow", "keyThreshold", "noteRow"} for fingerprint, or None
+def LoadCalibration(cachePath, fingerprint):
+    cache = ReadCalibrationCache(cachePath)
+    if fingerprint not in cache:
+        return None
+    cache[fingerprint]["lastUsed"] = time.time()
+    WriteCalibrationCache(cachePath, cache)
+    return cache[fingerprint]
+
+# Stores calibration for fingerprint, removing the least recently used entries past maxEntries
+def SaveCalibration(cachePath, fingerprint, filename, keyGroups, keyRow, keyThreshold, noteRow, maxEntries=64):
+    cache = ReadCalibrationCache(cachePath)
+    cache[fingerprint] = {"filename":filename, "keyGroups":keyGroups, "keyRow":keyRow,
+                          "keyThreshold":keyThreshold, "noteRow":noteRow, "lastUsed":time.time()}
+    while len(cache) > maxEntries:
+        oldest = min(cache, key=lambda entry:cache[entry]["lastUsed"])
+        cache.pop(oldest)
+    WriteCalibrationCache(cachePath, cache)
+
+# Removes cached calibrations for filename, or every cached calibration if filename is None
+def ClearCalibrationCache(cachePath, filename=None):
+    cache = ReadCalibrationCache(cachePath)
+    for fingerprint in list(cache):
+        if filename is None or cache[fingerprint]["filename"]==filename:
+            cache.pop(fingerprint)
+    WriteCalibrationCache(cachePath, cache)
+
+# Precomputes [start, end) column bounds for each key in keyGroups, ignoring noteBuffer pixels on either side
+# Keys whose range is empty after the buffer have no pixels to check and always count as pressed
+def CreateNoteColumns(keyGroups, noteBuffer):
+    bounds = np.array(keyGroups, dtype=np.intp).reshape(-1, 2)
+    starts = bounds[:,0] + noteBuffer
+    ends = bounds[:,1] + 1 - noteBuffer
+    empty = ends <= starts
+    return (starts, np.maximum(ends, starts), empty)
+
+# Finds the minimum intensity of each key inside the noteRow..noteRow+noteYRange band
+# frames can be a single frame (height x width) or a stack of frames (n x height x width)
+# Returns one intensity per key (or n x keys), empty keys read as 255
+def GetKeyIntensities(frames, noteRow, noteColumns, noteYRange):
+    starts, ends, empty = noteColumns
+    band = np.asarray(frames)[..., noteRow:noteRow+noteYRange, :]
+    bandMin = band.min(axis=-2)
+
+    # Pads one bright column so that ends equal to width are valid reduceat indices
+    padding = np.full(bandMin.shape[:-1]+(1,), 255, dtype=bandMin.dtype)
+    bandMin = np.concatenate((bandMin, padding), axis=-1)
+    bounds = np.clip(np.stack((starts, ends), axis=1).ravel(), 0, bandMin.shape[-1]-1)
+    intensities = np.minimum.reduceat(bandMin, bounds, axis=-1)[..., ::2]
+    intensities[..., empty] = 255
+    return intensities
+
+# Converts key intensities into noteArray (n x 88 for stacked input)
+# Pressed keys are keys with every pixel at or above noteThreshold
+def ClassifyKeys(intensities, noteThreshold):
+    pressed = np.asarray(intensities) >= noteThreshold
+    keyCount = min(pressed.shape[-1], 88)
+    noteArray = np.zeros(pressed.shape[:-1]+(88,), dtype=bool)
+    noteArray[..., :keyCount] = pressed[..., :keyCount]
+
+    # Attempts to fix overlapping keys
+    # Within a run of pressed keys, every second key is dropped while another pressed key follows it
+    index = np.arange(88)
+    runStart = np.maximum.accumulate(np.where(noteArray, 0, index+1), axis=-1)
+    nextPressed = np.zeros_like(noteArray)
+    nextPressed[..., :-1] = noteArray[..., 1:]
+    overlap = noteArray & nextPressed & ((index-runStart)%2==1)
+    noteArray[overlap] = False
+    return noteArray
+
 # Detects which keys are pressed in noteRow, returns boolean array of 88
+# frame can also be a stack of frames, which returns one row of 88 per frame
 # noteBuffer - Deciding horizontal range of solid pixels within key length that is needed to be counted as pressed, default 1
 # noteYRange - Deciding vertical range of solid pixels within key length that is needed to be counted as pressed, default 5
 # noteThreshold - Intensity of pixel to differentiate between black/white, default 70
-def GetNotes(frame, noteRow, keyGroups, noteBuffer, noteYRange, noteThreshold):
-    noteArray = [False] * 88 # Tracks whether key is active on current frame 
-
-    # Sets value of noteArray
-    for keyGroupNum in range(len(keyGroups)):
-        notePressed=True
-        for i in range(noteRow,noteRow+noteYRange):
-            for j in range(keyGroups[keyGroupNum][0]+noteBuffer,keyGroups[keyGroupNum][1]+1-noteBuffer):
-                if frame[i][j]<noteThreshold:
-                    notePressed = False
-                    break
-        if notePressed:
-            noteArray[keyGroupNum]=True
-            # Attempts to fix overlapping keys
-            if keyGroupNum>=2 and noteArray[keyGroupNum-1] and noteArray[keyGroupNum-2]:
-                noteArray[keyGroupNum-1]=False
-    return noteArray
+# noteColumns - Optional result of CreateNoteColumns, computed from keyGroups and noteBuffer if not given
+def GetNotes(frame, noteRow, keyGroups, noteBuffer, noteYRange, noteThreshold, noteColumns=None):
+    if noteColumns is None:
+        noteColumns = CreateNoteColumns(keyGroups, noteBuffer)
+    intensities = GetKeyIntensities(frame, noteRow, noteColumns, noteYRange)
+    return ClassifyKeys(intensities, noteThreshold)
     
+# Creates noteActive, the start time of the current note of each key or -1 for keys not pressed
+def CreateNoteActive():
+    return np.full(88, -1.0)
+
 # Updates noteList (list of notes) with noteArray (which keys are currently pressed)
 # Also takes noteActive (which keys were pressed in last frame) and timestamp
+# Only keys that started or ended since the last frame are touched
 def UpdateNotes(noteList, noteArray, noteActive, timestamp):
-    # Cycle through noteArrray and update entries of noteList and noteActive
-    for i in range(88):
-        if noteArray[i] and noteActive[i]==-1: # Start of note
+    changed = np.flatnonzero(np.asarray(noteArray) != (noteActive!=-1)) # Pressed now xor pressed last frame
+    for i in changed.tolist():
+        if noteArray[i]: # Start of note
             noteActive[i]=timestamp
-        elif noteArray[i] and noteActive[i]!=-1: # Continuation of note
-            pass
-        elif not noteArray[i] and noteActive[i]==-1: # Do nothing
-            pass
-        elif not noteArray[i] and noteActive[i]!=-1: # End of note
-            noteList.append([i,noteActive[i],timestamp])
+        else: # End of note
+            noteList.append([i,float(noteActive[i]),timestamp])
             noteActive[i]=-1
-        else:
-            Exception("noteArray, noteActive combo not found")
 
-def DrawKeyGroups(frame,keyGroups,height,keyThreshold,row):
+# Same as calling UpdateNotes for each row of noteArrays (frames x 88) and timestamps, in one pass
+def UpdateNotesBatch(noteList, noteArrays, noteActive, timestamps):
+    noteArrays = np.asarray(noteArrays, dtype=bool)
+    timestamps = np.asarray(timestamps, dtype=float)
+    if len(noteArrays)==0:
+        return
+    activeStarts = noteActive.copy()
+    (_, keys, starts, ends), (_, openKeys, openStarts) = NotesFromStates(noteArrays[:, None, :], (activeStarts!=-1)[None, :])
+
+    # Notes that started before the batch keep their start time from noteActive
+    startTimes = np.where(starts>=0, timestamps[starts], activeStarts[keys])
+    order = np.lexsort((keys, ends)) # UpdateNotes ends notes frame by frame, in key order
+    noteList.extend([[key, start, end] for key, start, end in
+                     zip(keys[order].tolist(), startTimes[order].tolist(), timestamps[ends[order]].tolist())])
+
+    noteActive[:] = -1
+    noteActive[openKeys] = np.where(openStarts>=0, timestamps[openStarts], activeStarts[openKeys])
+
+# Per-frame record of the timestamp and the minimum band intensity of each key (see GetKeyIntensities)
+INTENSITY_DTYPE = np.dtype([("timestamp", "<f8"), ("keys", "u1", (88,))])
+
+# Builds an intensity record from lists of timestamps and key intensities
+def IntensityRecord(timestamps, intensities):
+    record = np.zeros(len(timestamps), dtype=INTENSITY_DTYPE)
+    if len(timestamps):
+        record["timestamp"] = timestamps
+        record["keys"] = np.asarray(intensities).reshape(len(timestamps), -1)[:, :88]
+    return record
+
+# Writes an intensity record to a .npy file
+def SaveIntensities(path, record):
+    np.save(path, record)
+
+# Memory maps an intensity record written by SaveIntensities
+def LoadIntensities(path):
+    return np.load(path, mmap_mode="r")
+
+# Replays UpdateNotes over an intensity record with any noteThreshold, without decoding the video
+# Returns (noteList, noteActive)
+def NotesFromIntensities(record, noteThreshold):
+    noteList = []
+    noteActive = CreateNoteActive()
+    UpdateNotesBatch(noteList, ClassifyKeys(record["keys"], noteThreshold), noteActive, record["timestamp"])
+    return (noteList, noteActive)
+
+# Finds key intensities for several noteBuffer and noteYRange settings at once
+# noteColumnsList - One CreateNoteColumns result per noteBuffer
+# Returns (... x buffers x maxYRange x keys), entry [b, y] is the intensity GetKeyIntensities gives for noteYRange y+1
+def GetSweepIntensities(frames, noteRow, noteColumnsList, maxYRange):
+    band = np.asarray(frames)[..., noteRow:noteRow+maxYRange, :]
+    padding = np.full(band.shape[:-1]+(1,), 255, dtype=band.dtype)
+    band = np.concatenate((band, padding), axis=-1)
+
+    sweepIntensities = []
+    for starts, ends, empty in noteColumnsList:
+        bounds = np.clip(np.stack((starts, ends), axis=1).ravel(), 0, band.shape[-1]-1)
+        rowIntensities = np.minimum.reduceat(band, bounds, axis=-1)[..., ::2]
+        rowIntensities[..., empty] = 255
+        sweepIntensities.append(np.minimum.accumulate(rowIntensities, axis=-2)) # Minimum over the first y+1 rows
+    return np.stack(sweepIntensities, axis=-3)
+
+# Writes a sweep record (timestamps plus GetSweepIntensities per frame) to a .npy file
+# The noteBuffers of the record are kept next to it in path.json
+def SaveSweep(path, timestamps, sweepIntensities, noteBuffers):
+    sweepIntensities = np.asarray(sweepIntensities)
+    record = np.zeros(len(timestamps), dtype=[("timestamp", "<f8"), ("keys", "u1", sweepIntensities.shape[1:])])
+    if len(timestamps):
+        record["timestamp"] = timestamps
+        record["keys"] = sweepIntensities
+    np.save(path, record)
+    with open(path+".json", "w") as sweepInfo:
+        json.dump({"noteBuffers":list(noteBuffers), "maxYRange":int(record["keys"].shape[2])}, sweepInfo)
+
+# Memory maps a sweep record written by SaveSweep, returns (record, noteBuffers)
+def LoadSweep(path):
+    with open(path+".json") as sweepInfo:
+        noteBuffers = json.load(sweepInfo)["noteBuffers"]
+    return (np.load(path, mmap_mode="r"), noteBuffers)
+
+# Pairs note starts and ends in a frames x settings x 88 state array
+# initial - Optional settings x 88 state before the first frame, notes active before it start at frame -1
+# Returns ((setting, key, start frame, end frame), (setting, key, start frame)) arrays of the finished notes
+# and of the notes still active on the last frame, ordered by setting, key and time
+def NotesFromStates(states, initial=None):
+    states = np.moveaxis(states, 0, -1) # settings x 88 x frames
+    previous = np.zeros_like(states)
+    previous[..., 1:] = states[..., :-1]
+    if initial is not None:
+        previous[..., 0] = initial
+    startSetting, startKey, startFrames = np.nonzero(states & ~previous)
+    endSetting, endKey, endFrames = np.nonzero(previous & ~states)
+
+    if initial is not None:
+        initialSetting, initialKey = np.nonzero(np.broadcast_to(initial, states.shape[:-1]))
+        startSetting = np.concatenate((initialSetting, startSetting))
+        startKey = np.concatenate((initialKey, startKey))
+        startFrames = np.concatenate((np.full(len(initialKey), -1), startFrames))
+        order = np.lexsort((startFrames, startKey, startSetting))
+        startSetting, startKey, startFrames = startSetting[order], startKey[order], startFrames[order]
+
+    # The nth end of a key closes its nth start, starts past the last end are still active
+    keyCount = states.shape[1]
+    groupCount = states.shape[0]*keyCount
+    startGroups = startSetting*keyCount+startKey
+    endCounts = np.bincount(endSetting*keyCount+endKey, minlength=groupCount)
+    startOffsets = np.concatenate(([0], np.cumsum(np.bincount(startGroups, minlength=groupCount))[:-1]))
+    finished = np.arange(len(startGroups))-startOffsets[startGroups] < endCounts[startGroups]
+    return ((endSetting, endKey, startFrames[finished], endFrames),
+            (startSetting[~finished], startKey[~finished], startFrames[~finished]))
+
+# Evaluates noteThresholds for each noteBuffer and noteYRange in a sweep record in one vectorized pass
+# Reports note count, the most common rounded note lengths (as counted by CalcNoteLength), the fraction of
+# notes shorter than shortNoteLength ms (usually particle effects) and the tempo CalcNoteLength would pick
+def SweepSettings(record, noteBuffers, noteThresholds, noteYRanges=None, shortNoteLength=50, histogramSize=10):
+    timestamps = np.asarray(record["timestamp"])
+    maxYRange = record["keys"].shape[2]
+    if noteYRanges is None:
+        noteYRanges = range(1, maxYRange+1)
+    noteThresholds = np.asarray(noteThresholds)
+
+    report = []
+    for b, noteBuffer in enumerate(noteBuffers):
+        for noteYRange in noteYRanges:
+            intensities = np.asarray(record["keys"][:, b, noteYRange-1]) # frames x 88
+            states = ClassifyKeys(intensities[:, None, :], noteThresholds[:, None]) # frames x thresholds x 88
+            (setting, key, starts, ends), _ = NotesFromStates(states)
+            lengths = timestamps[ends]-timestamps[starts]
+
+            for t, noteThreshold in enumerate(noteThresholds.tolist()):
+                chosen = setting==t
+                noteLengths = np.round(lengths[chosen])
+                entry = {"noteBuffer":noteBuffer, "noteYRange":noteYRange, "noteThreshold":noteThreshold,
+                         "noteCount":int(chosen.sum()), "noteLengths":[], "shortNotes":0.0, "tempo":None}
+                if entry["noteCount"]:
+                    # Ties between lengths go to the length of the earliest ending note, like CalcNoteLength
+                    order = np.lexsort((key[chosen], ends[chosen]))
+                    values, firstIndex, counts = np.unique(noteLengths[order], return_index=True, return_counts=True)
+                    common = np.lexsort((firstIndex, -counts))[:histogramSize]
+                    entry["noteLengths"] = [(float(values[i]), int(counts[i])) for i in common]
+                    entry["shortNotes"] = float(np.mean(lengths[chosen]<shortNoteLength))
+                    if values[common[0]]>0:
+                        entry["tempo"] = FoldTempo(float(values[common[0]]))[0]
+                report.append(entry)
+    return report
+
+# Grabs frames without decoding them into images until the timestamp reaches target (ms)
+# Only the frame that reaches target is retrieved, returns (ret, frame, timestamp)
+def GrabUntil(cap, target):
+    while True:
+        if not cap.grab(): # No frame grabbed
+            return (False, None, cap.get(cv2.CAP_PROP_POS_MSEC))
+        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if timestamp>=target:
+            ret, frame = cap.retrieve()
+            return (ret, frame, timestamp)
+
+# Seeks to the first frame with a timestamp at or after target (ms) and reads it
+# Seeks seekMargin ms early and grabs forward, so the frame and timestamp match reading from the start
+# Seeks further back if the seek lands past target, returns (ret, frame, timestamp)
+def SeekFrame(cap, target, seekMargin=1000):
+    seekTo = target - seekMargin
+    while seekTo > 0:
+        cap.set(cv2.CAP_PROP_POS_MSEC, seekTo)
+        if not cap.grab(): # Seeked past the end of the video
+            return (False, None, cap.get(cv2.CAP_PROP_POS_MSEC))
+        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if timestamp<target: # Landed before target, scan forward from here
+            return GrabUntil(cap, target)
+        seekMargin *= 2
+        seekTo = target - seekMargin
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0) # Scan from the first frame
+    return GrabUntil(cap, target)
+
+# Yields (timestamp, frame) from the current frame of cap until lastFrame or the end of the video
+def ReadFrames(cap, ret, frame, timestamp, lastFrame):
+    while ret and timestamp <= lastFrame: # ret is false if no frames have been grabbed
+        yield (timestamp, frame)
+        ret, frame = cap.read()
+        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+
+# Frame source that decodes with cv2.VideoCapture and keeps only the grayscale band rows bandTop to bandTop+bandHeight
+# Only the band is converted to grayscale, full frames are kept only if keepFrames is set (for debug images)
+# Read jumps forward by grabbing frames when the target is at most seekDistance frames ahead, otherwise it seeks
+# instruments - Optional Instrumentation, times the read and convert stages and counts framesDecoded
+class CaptureBandSource:
+    def __init__(self, cap, bandTop, bandHeight, keepFrames=False, seekDistance=16, instruments=None):
+        self.cap = cap
+        self.bandTop = bandTop
+        self.bandHeight = bandHeight
+        self.keepFrames = keepFrames
+        self.seekDistance = seekDistance
+        self.instruments = instruments if instruments is not None else NO_INSTRUMENTS
+
+    # Returns the grayscale band of a BGR frame
+    def Band(self, frame):
+        return cv2.cvtColor(frame[self.bandTop:self.bandTop+self.bandHeight], cv2.COLOR_BGR2GRAY)
+
+    # Index of the next frame cap will read
+    def Index(self):
+        return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+    # Yields (timestamp, band, frame) from the current frame of cap until lastFrame, frame is None unless keepFrames
+    def Frames(self, ret, frame, timestamp, lastFrame):
+        frames = ReadFrames(self.cap, ret, frame, timestamp, lastFrame)
+        while True:
+            with self.instruments.Stage("read"):
+                item = next(frames, None)
+            if item is None:
+                return
+            timestamp, frame = item
+            with self.instruments.Stage("convert"):
+                band = self.Band(frame)
+            self.instruments.Count("framesDecoded")
+            yield (timestamp, band, frame if self.keepFrames else None)
+
+    # Reads the frame at index, returns (ret, timestamp, band, frame), frame is None unless keepFrames
+    def Read(self, index):
+        with self.instruments.Stage("read"):
+            skip = index - self.Index()
+            if 0 <= skip <= self.seekDistance: # Close ahead, cheaper to decode forward than to seek
+                for _ in range(skip):
+                    self.cap.grab()
+            else:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = self.cap.read()
+            timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if not ret:
+            return (False, timestamp, None, None)
+        self.instruments.Count("framesDecoded")
+        with self.instruments.Stage("convert"):
+            band = self.Band(frame)
+        return (True, timestamp, band, frame if self.keepFrames else None)
+
+# Frame source that has a local ffmpeg crop the band and convert it to gray, frames are read as raw bytes from a pipe
+# Each band is a NumPy view of the bytes read from the pipe (no copy), full frames are never decoded into Python
+# Timestamps follow the nominal frame rate, so variable frame rate videos should use CaptureBandSource
+# instruments - Optional Instrumentation, times the read stage (waiting on the pipe) and counts framesDecoded
+class FFmpegBandSource:
+    def __init__(self, filename, bandTop, bandHeight, width, fps, ffmpeg="ffmpeg", instruments=None):
+        self.filename = filename
+        self.bandTop = bandTop
+        self.bandHeight = bandHeight
+        self.width = width
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.instruments = instruments if instruments is not None else NO_INSTRUMENTS
+
+    # Yields (timestamp, band, None) starting at the frame at timestamp until lastFrame or the end of the video
+    # ret and frame are the current frame of the VideoCapture that found timestamp, only ret is used
+    def Frames(self, ret, frame, timestamp, lastFrame):
+        if not ret:
+            return
+        frameLength = 1000/self.fps
+        firstIndex = round(timestamp/frameLength)
+        command = [self.ffmpeg, "-v", "error", "-nostdin",
+                   "-ss", "%.6f" % (max(0, timestamp-frameLength/2)/1000), "-i", self.filename, # Half a frame early so rounding can't skip it
+                   "-vf", "crop=%d:%d:0:%d,format=gray" % (self.width, self.bandHeight, self.bandTop),
+                   "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"]
+        pipe = subprocess.Popen(command, stdout=subprocess.PIPE)
+        bandSize = self.width*self.bandHeight
+        try:
+            index = firstIndex
+            while index*frameLength <= lastFrame:
+                buffer = bytearray(bandSize) # New buffer per band, yielded bands stay valid
+                view = memoryview(buffer)
+                filled = 0
+                with self.instruments.Stage("read"):
+                    while filled < bandSize:
+                        count = pipe.stdout.readinto(view[filled:])
+                        if not count: # End of the video
+                            break
+                        filled += count
+                if filled < bandSize:
+                    return
+                self.instruments.Count("framesDecoded")
+                yield (index*frameLength, np.frombuffer(buffer, np.uint8).reshape(self.bandHeight, self.width), None)
+                index += 1
+        finally:
+            pipe.kill()
+            pipe.stdout.close()
+            pipe.wait()
+
+# Compares each band to the last band that was analyzed, a band is unchanged if no pixel differs by more than tolerance
+# hits counts unchanged bands whose analysis was skipped, misses counts bands that were analyzed
+class BandChangeDetector:
+    def __init__(self, tolerance=0):
+        self.tolerance = tolerance
+        self.reference = None # Last band that was analyzed
+        self.hits = 0
+        self.misses = 0
+
+    # Returns False if band matches the last analyzed band, the first band always counts as changed
+    def Changed(self, band):
+        if self.reference is not None and self.reference.shape == band.shape:
+            if self.tolerance == 0:
+                unchanged = np.array_equal(band, self.reference)
+            else:
+                unchanged = cv2.absdiff(band, self.reference).max() <= self.tolerance
+            if unchanged:
+                self.hits += 1
+                return False
+        self.reference = band
+        self.misses += 1
+        return True
+
+    # Adds the hit/miss counters to stats
+    def AddStats(self, stats):
+        stats["bandHits"] = stats.get("bandHits", 0) + self.hits
+        stats["bandMisses"] = stats.get("bandMisses", 0) + self.misses
+
+# Creates the frame source named frameSource ("capture" or "ffmpeg") reading the band of the video open in cap
+def OpenFrameSource(frameSource, filename, cap, bandTop, bandHeight, keepFrames=False, instruments=None):
+    if frameSource == "capture":
+        return CaptureBandSource(cap, bandTop, bandHeight, keepFrames, instruments=instruments)
+    if frameSource == "ffmpeg":
+        if keepFrames:
+            raise ValueError("ffmpeg frame source only reads the note band, debug images need frameSource=\"capture\"")
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        return FFmpegBandSource(filename, bandTop, bandHeight, width, cap.get(cv2.CAP_PROP_FPS) or 30, instruments=instruments)
+    raise ValueError("Unknown frame source "+repr(frameSource))
+
+# Reads every stride-th frame of source from the current frame of cap until lastFrame or the end of the video
+# Bisects between two reads whose key states differ to find the exact frame each key state change happens on
+# analyze((band, frame)) returns a result and keyState(result) the key state compared between frames
+# Yields (timestamp, (band, frame), result) for the first frame and each frame where the key state changes
+# A note shorter than stride frames, or a key released and pressed again within stride frames, can be missed
+def StrideFrames(source, ret, frame, timestamp, lastFrame, stride, analyze, keyState):
+    # Returns (timestamp, (band, frame), result, state) of the frame at index, None past lastFrame or the end
+    def Sample(index):
+        ret, timestamp, band, frame = source.Read(index)
+        if not ret or timestamp > lastFrame:
+            return None
+        result = analyze((band, frame))
+        return (timestamp, (band, frame), result, keyState(result))
+
+    if not ret or timestamp > lastFrame:
+        return
+    index = source.Index()-1 # Index of the current frame
+    item = (source.Band(frame), frame if source.keepFrames else None)
+    result = analyze(item)
+    current = (timestamp, item, result, keyState(result))
+    yield current[:3]
+
+    finished = False
+    while not finished:
+        nextIndex = index+stride
+        sample = Sample(nextIndex)
+        if sample is None: # Finds the last frame before lastFrame or the end of the video
+            low, high = index, nextIndex
+            while high-low > 1:
+                middle = (low+high)//2
+                middleSample = Sample(middle)
+                if middleSample is None:
+                    high = middle
+                else:
+                    low, sample = middle, middleSample
+            if low == index:
+                return
+            nextIndex = low
+            finished = True
+
+        # Each bisection finds the first frame after index that differs from the current key state
+        # Bisects while the frames left are far apart, then reads forward since seeking back costs more than decoding
+        while not np.array_equal(sample[3], current[3]):
+            low, high, highSample = index, nextIndex, sample
+            while high-low > 1:
+                if high-low <= source.seekDistance:
+                    middle = low+1
+                else:
+                    middle = (low+high)//2
+                middleSample = Sample(middle)
+                if np.array_equal(middleSample[3], current[3]):
+                    low = middle
+                else:
+                    high, highSample = middle, middleSample
+            index, current = high, highSample
+            yield current[:3]
+        index, current = nextIndex, sample
+
+# Runs analyze(frame) on worker threads while frames are decoded on a decoder thread
+# The decoder and workers are connected by a bounded queue, OpenCV releases the GIL so decoding overlaps analysis
+# Yields (timestamp, frame, result) in the same order as frames
+def PipelineFrames(frames, analyze, workers=2, queueSize=32):
+    frameQueue = queue.Queue(queueSize)
+    resultQueue = queue.Queue()
+    inFlight = threading.Semaphore(queueSize+workers) # Frames decoded but not yet yielded
+    stop = threading.Event()
+
+    def Decoder():
+        try:
+            for seq, (timestamp, frame) in enumerate(frames): # frame can be any item passed to analyze
+                inFlight.acquire()
+                if stop.is_set():
+                    break
+                frameQueue.put((seq, timestamp, frame))
+        except Exception as error:
+            resultQueue.put((-1, None, None, error))
+        finally:
+            for _ in range(workers):
+                frameQueue.put(None)
+
+    def Worker():
+        while True:
+            item = frameQueue.get()
+            if item is None:
+                resultQueue.put(None)
+                break
+            seq, timestamp, frame = item
+            if stop.is_set(): # Caller stopped reading results
+                continue
+            try:
+                resultQueue.put((seq, timestamp, frame, analyze(frame)))
+            except Exception as error:
+                resultQueue.put((-1, None, None, error))
+
+    threads = [threading.Thread(target=Decoder, daemon=True)]
+    threads += [threading.Thread(target=Worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        pending = {} # Results that finished ahead of an earlier frame
+        nextSeq = 0
+        finished = 0
+        while finished < workers:
+            item = resultQueue.get()
+            if item is None:
+                finished += 1
+                continue
+            seq, timestamp, frame, result = item
+            if seq == -1: # Error from decoder or worker
+                raise result
+            pending[seq] = (timestamp, frame, result)
+            while nextSeq in pending:
+                yield pending.pop(nextSeq)
+                inFlight.release()
+                nextSeq += 1
+    finally:
+        # Unblocks the decoder and lets the workers drain the queue if the caller stops early
+        stop.set()
+        inFlight.release()
+        for thread in threads:
+            thread.join()
+
+# Transcribes one time segment of the video in its own process with its own VideoCapture
+# Reads frames from segmentStart up to segmentEnd (exclusive), or up to lastFrame if segmentEnd is None
+# Starts with no keys active, returns (noteList, noteActive, first noteArray, first timestamp, record, stats) for MergeSegments
+# record is the intensity record of the segment if recordIntensities is set, otherwise None
+# stats holds the band change counters of the segment, see BandChangeDetector
+# instrument adds the Instrumentation State of the segment to stats as "instruments"
+def TranscribeSegment(filename, segmentStart, segmentEnd, lastFrame, noteRow, keyGroups,
+                      noteBuffer, noteYRange, noteThreshold, debugMode="off", debugEvery=1, recordIntensities=False,
+                      frameSource="capture", changeTolerance=0, instrument=False):
+    instruments = Instrumentation() if instrument else NO_INSTRUMENTS
+    cap = cv2.VideoCapture(filename)
+    noteColumns = CreateNoteColumns(keyGroups, noteBuffer)
+    debug = DebugWriter(debugMode, debugEvery, instruments=instruments)
+    source = OpenFrameSource(frameSource, filename, cap, noteRow, noteYRange, debug.enabled, instruments)
+    detector = BandChangeDetector(changeTolerance) if changeTolerance is not None else None
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    noteList = []
+    noteActive = CreateNoteActive()
+    firstNoteArray, firstTimestamp = None, None
+    timestamps, intensityList = [], []
+
+    try:
+        with instruments.Stage("seek"):
+            ret, frame, timestamp = SeekFrame(cap, segmentStart)
+        for timestamp, band, frame in source.Frames(ret, frame, timestamp, lastFrame):
+            if segmentEnd is not None and timestamp>=segmentEnd:
+                instruments.Count("framesDecoded", -1) # First frame of the next segment, counted there
+                break
+            with instruments.Stage("compare"):
+                changed = detector is None or detector.Changed(band)
+            if changed: # Unchanged bands keep the last intensities
+                instruments.Count("framesAnalyzed")
+                with instruments.Stage("detect"):
+                    intensities = GetKeyIntensities(band, 0, noteColumns, noteYRange)
+                with instruments.Stage("classify"):
+                    noteArray = ClassifyKeys(intensities, noteThreshold)
+                if firstTimestamp is None:
+                    firstNoteArray, firstTimestamp = noteArray, timestamp
+                with instruments.Stage("update"):
+                    UpdateNotes(noteList, noteArray, noteActive, timestamp)
+                if debug.Sample(noteArray):
+                    with instruments.Stage("debug"):
+                        DrawReader(frame,noteArray,keyGroups,noteRow,height,timestamp,debug)
+            if recordIntensities:
+                timestamps.append(timestamp)
+                intensityList.append(intensities)
+    finally:
+        debug.Close()
+        cap.release()
+
+    record = IntensityRecord(timestamps, intensityList) if recordIntensities else None
+    stats = {}
+    if detector is not None:
+        detector.AddStats(stats)
+        instruments.Count("framesSkipped", detector.hits)
+    if instrument:
+        stats["instruments"] = instruments.State()
+    return (noteList, noteActive, firstNoteArray, firstTimestamp, record, stats)
+
+# Joins segment results from TranscribeSegment (in time order) into one noteList
+# Notes active at the end of a segment continue into the next one, so the result matches a serial run
+# Returns (noteList, noteActive) with noteActive holding notes that are still active after the last segment
+def MergeSegments(segments):
+    noteList = []
+    noteActive = CreateNoteActive()
+
+    for segmentNotes, segmentActive, firstNoteArray, firstTimestamp, _, _ in segments:
+        if firstTimestamp is None: # Segment has no frames
+            continue
+
+        # Notes active before the segment that end on its first frame
+        for i in range(88):
+            if noteActive[i]!=-1 and not firstNoteArray[i]:
+                noteList.append([i,float(noteActive[i]),firstTimestamp])
+                noteActive[i]=-1
+
+        # Notes the segment started on its first frame may have started in an earlier segment
+        for note in segmentNotes:
+            if note[1]==firstTimestamp and noteActive[note[0]]!=-1:
+                note = [note[0],float(noteActive[note[0]]),note[2]]
+                noteActive[note[0]]=-1
+            noteList.append(note)
+        for i in range(88):
+            if segmentActive[i]==firstTimestamp and noteActive[i]!=-1:
+                continue # Still active from an earlier segment
+            noteActive[i]=segmentActive[i]
+
+    return (noteList, noteActive)
+
+# Returns lastFrame, or the length of the video in ms if it is known and shorter
+def VideoEnd(cap, lastFrame):
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frameCount = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    if fps>0 and frameCount>0:
+        return min(lastFrame, frameCount*1000/fps)
+    return lastFrame
+
+# Splits firstFrame..lastFrame into one time segment per process and transcribes them in a process pool
+# keyGroups and noteRow come from a single calibration
+# Returns (noteList, noteActive, record) with the joined intensity record (None unless recordIntensities is set)
+# Adds the band change counters of every segment to stats if it is given
+# instruments - Optional Instrumentation, gets the stage timings and counters of every segment added up
+def TranscribeSegments(filename, firstFrame, lastFrame, processes, noteRow, keyGroups,
+                       noteBuffer, noteYRange, noteThreshold, debugMode="off", debugEvery=1, recordIntensities=False,
+                       frameSource="capture", changeTolerance=0, stats=None, instruments=None):
+    # Segments stop at the end of the video when its length is known
+    cap = cv2.VideoCapture(filename)
+    endFrame = VideoEnd(cap, lastFrame)
+    cap.release()
+    bounds = np.linspace(firstFrame, max(firstFrame, endFrame), processes+1).tolist()
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = []
+        for i in range(processes):
+            segmentEnd = bounds[i+1] if i<processes-1 else None # Last segment runs to lastFrame
+            futures.append(executor.submit(TranscribeSegment, filename, bounds[i], segmentEnd, lastFrame, noteRow, keyGroups,
+                                           noteBuffer, noteYRange, noteThreshold, debugMode, debugEvery, recordIntensities,
+                                           frameSource, changeTolerance, instruments is not None and instruments.enabled))
+        segments = [future.result() for future in futures]
+
+    for segment in segments:
+        if "instruments" in segment[5]:
+            instruments.Merge(segment[5].pop("instruments"))
+        if stats is not None:
+            for name, count in segment[5].items():
+                stats[name] = stats.get(name, 0) + count
+
+    noteList, noteActive = MergeSegments(segments)
+    record = np.concatenate([segment[4] for segment in segments]) if recordIntensities else None
+    return (noteList, noteActive, record)
+
+def DrawKeyGroups(frame,keyGroups,height,keyThreshold,row,debug):
     counter = 0
     cv2.rectangle(frame,(0,height-40),(len(frame[0]),height),(0,0,0),-1)
     for pair in keyGroups:
@@ -81,10 +834,10 @@ def DrawKeyGroups(frame,keyGroups,height,keyThreshold,row):
         else:
             color = (0,255,0)
         cv2.rectangle(frame,(pair[0], height-40),(pair[1],height),color,-1)
-    cv2.imwrite("Frames/KeyGroups "+str(round(row,2))+" "+str(keyThreshold)+"Drawn.png", frame)
+    debug.Save("Frames/KeyGroups "+str(round(row,2))+" "+str(keyThreshold)+"Drawn.png", frame.copy())
 
 # Draws images of frames being read
-def DrawReader(frame,noteArray,keyGroups,noteRow,height,timestamp):
+def DrawReader(frame,noteArray,keyGroups,noteRow,height,timestamp,debug):
     counter = 0
     for pair in keyGroups:
         counter += 1
@@ -100,7 +853,170 @@ def DrawReader(frame,noteArray,keyGroups,noteRow,height,timestamp):
         else:
             color = (255,255,255)
         cv2.rectangle(frame,(keyGroups[i][0],noteRow),(keyGroups[i][1],noteRow+2),color,-1)
-    cv2.imwrite("Frames/"+str(round(timestamp,2))+" Drawn.png", frame)
+    debug.Save("Frames/"+str(round(timestamp,2))+" Drawn.png", frame)
+
+# Cumulative stage timings and counters of one transcription, see main(report=True)
+# Stage(name) times a with block and Count(name) adds to a counter, both can be used from several threads
+# profileStage - Optional stage run under profiler (a cProfile.Profile by default) each time it is timed on the thread
+#                that created the Instrumentation, profiler can be any object with enable() and disable()
+# A disabled Instrumentation times and counts nothing, NO_INSTRUMENTS is used where none is given
+class Instrumentation:
+    def __init__(self, profileStage=None, profiler=None, enabled=True):
+        self.enabled = enabled
+        self.seconds = {} # Stage name to total seconds
+        self.calls = {}
+        self.longest = {} # Stage name to its longest call in seconds
+        self.counters = {}
+        self.profileStage = profileStage
+        self.profiler = profiler if profiler is not None or profileStage is None else cProfile.Profile()
+        self.thread = threading.get_ident()
+        self.lock = threading.Lock()
+
+    # Returns a context manager that adds the time spent in its with block to stage name
+    def Stage(self, name):
+        if not self.enabled:
+            return NO_STAGE
+        return StageTimer(self, name)
+
+    def Add(self, name, seconds, calls=1, longest=None):
+        with self.lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + calls
+            self.longest[name] = max(self.longest.get(name, 0.0), seconds if longest is None else longest)
+
+    def Count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Timings and counters as plain dicts, sent back from worker processes
+    def State(self):
+        return {"seconds": dict(self.seconds), "calls": dict(self.calls), "longest": dict(self.longest),
+                "counters": dict(self.counters)}
+
+    # Adds the State of another Instrumentation
+    def Merge(self, state):
+        for name, seconds in state["seconds"].items():
+            self.Add(name, seconds, state["calls"][name], state["longest"][name])
+        for name, amount in state["counters"].items():
+            self.Count(name, amount)
+
+    # Returns the report as a JSON serializable dict, stages are sorted by total time
+    # Each stage has its total seconds, calls, mean and longest call in ms and ms per decoded frame
+    # A cProfile profiler adds its statistics of the profiled stage, sorted by cumulative time
+    def Report(self, profileLines=30):
+        frames = self.counters.get("framesDecoded", 0)
+        stages = {}
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            stages[name] = {"seconds": round(seconds, 6), "calls": self.calls[name],
+                            "meanMs": round(1000*seconds/self.calls[name], 4), "longestMs": round(1000*self.longest[name], 4),
+                            "msPerFrame": round(1000*seconds/frames, 4) if frames else None}
+        report = {"stages": stages, "counters": dict(self.counters)}
+        if isinstance(self.profiler, cProfile.Profile) and self.profiler.getstats():
+            text = io.StringIO()
+            pstats.Stats(self.profiler, stream=text).sort_stats("cumulative").print_stats(profileLines)
+            report["profile"] = {"stage": self.profileStage, "text": text.getvalue()}
+        return report
+
+# Times one with block of Instrumentation.Stage
+class StageTimer:
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        instruments = self.instruments
+        self.profiling = (instruments.profiler is not None and self.name == instruments.profileStage
+                          and threading.get_ident() == instruments.thread)
+        if self.profiling:
+            instruments.profiler.enable()
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, *error):
+        seconds = time.perf_counter() - self.startTime
+        if self.profiling:
+            self.instruments.profiler.disable()
+        self.instruments.Add(self.name, seconds)
+        return False
+
+NO_STAGE = contextlib.nullcontext()
+NO_INSTRUMENTS = Instrumentation(enabled=False)
+
+# Saves debug images in the background so encoding and disk writes don't hold up detection
+# mode - "off", "every" (every Nth analyzed frame) or "changes" (frames where a note state changes)
+# every - N for "every" mode
+# video - Optional path of one annotated MP4 that images are written to instead of PNGs in Frames/
+# writers - Number of background PNG writers, queueSize - Images waiting to be written before Save blocks
+# instruments - Optional Instrumentation, times the debugWrite stage of the writers
+class DebugWriter:
+    def __init__(self, mode="off", every=1, video=None, fps=30, writers=2, queueSize=16, instruments=None):
+        if mode not in ("off", "every", "changes"):
+            raise ValueError("Unknown debug mode "+str(mode))
+        self.mode = mode
+        self.enabled = (mode!="off")
+        self.every = max(1, every)
+        self.video = video
+        self.fps = fps
+        self.frameCount = 0 # Analyzed frames seen by Sample
+        self.lastNoteArray = np.zeros(88, dtype=bool) # No keys are pressed before the first frame
+        self.videoWriter = None
+        self.threads = []
+        self.instruments = instruments if instruments is not None else NO_INSTRUMENTS
+
+        if not self.enabled:
+            return
+        if video is None and not os.path.isdir("Frames"):
+            os.makedirs("Frames")
+        if video is not None:
+            writers = 1 # Video frames have to be encoded in order
+        self.images = queue.Queue(queueSize)
+        for _ in range(writers):
+            thread = threading.Thread(target=self.Writer, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    # Checks whether the current analyzed frame should be drawn
+    def Sample(self, noteArray):
+        self.frameCount += 1
+        if self.mode=="every":
+            return (self.frameCount-1)%self.every==0
+        if self.mode=="changes":
+            changed = not np.array_equal(noteArray, self.lastNoteArray)
+            self.lastNoteArray = np.array(noteArray, dtype=bool)
+            return changed
+        return False
+
+    # Queues image to be written to path (or to the debug video)
+    def Save(self, path, image):
+        if self.enabled:
+            self.images.put((path, image))
+
+    def Writer(self):
+        while True:
+            item = self.images.get()
+            if item is None:
+                break
+            path, image = item
+            with self.instruments.Stage("debugWrite"):
+                if self.video is None:
+                    cv2.imwrite(path, image)
+                else:
+                    if self.videoWriter is None:
+                        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+                        self.videoWriter = cv2.VideoWriter(self.video, fourcc, self.fps, (image.shape[1], image.shape[0]))
+                    self.videoWriter.write(image)
+
+    # Waits for queued images to be written
+    def Close(self):
+        for _ in self.threads:
+            self.images.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.videoWriter is not None:
+            self.videoWriter.release()
+            self.videoWriter = None
 
 # Counts length of notes, finds most common length, calcs tempo and tempoLength
 def CalcNoteLength(noteList):
@@ -116,7 +1032,14 @@ def CalcNoteLength(noteList):
     noteLengthsList = list(noteLengths.items())
     noteLengthsList.sort(key = lambda x:x[1],reverse=True)
     #print(noteLengthsList)
-    tempoLength = noteLengthsList[0][0]
+    tempoBPM, tempoLength = FoldTempo(noteLengthsList[0][0])
+    print("TEMPO LENGT"+str(tempoLength)) 
+    print("TEMPO BPM"+str(tempoBPM))
+    return (tempoBPM, tempoLength)
+
+# Doubles or halves the tempo of a beat lasting tempoLength ms until it is between 100 and 199 BPM
+# Returns (tempoBPM, tempoLength)
+def FoldTempo(tempoLength):
     tempoBPM = 60000/tempoLength
     while (tempoBPM<100 or tempoBPM>199):
         if tempoBPM<100:
@@ -124,45 +1047,135 @@ def CalcNoteLength(noteList):
         else:
             tempoBPM /= 2
         tempoLength = 60000/tempoBPM
-    print("TEMPO LENGT"+str(tempoLength)) 
-    print("TEMPO BPM"+str(tempoBPM))
     return (tempoBPM, tempoLength)
 
+# Notes as (noteIndex, startTime, endTime) and beats as (noteIndex, starting beat number, beat duration) records
+NOTE_DTYPE = np.dtype([("key", "<i2"), ("start", "<f8"), ("end", "<f8")])
+BEAT_DTYPE = np.dtype([("key", "<i2"), ("start", "<f8"), ("length", "<f8")])
+
+# Converts a noteList of [noteIndex, startTime, endTime] entries to a NOTE_DTYPE array (arrays are returned as they are)
+def NoteArray(noteList):
+    if isinstance(noteList, np.ndarray):
+        return noteList
+    return np.fromiter((tuple(note) for note in noteList), NOTE_DTYPE, len(noteList))
+
+# Yields the records of a structured array as tuples of Python values, converting chunkSize records at a time
+def IterRecords(records, chunkSize=4096):
+    for chunkStart in range(0, len(records), chunkSize):
+        yield from records[chunkStart:chunkStart+chunkSize].tolist()
+
+# Estimates the tempo of noteList from its note onsets with an autocorrelation of the onset train
+# Onsets closer than onsetTolerance ms are merged (chords), the onset train is built on a resolution ms grid
+# Looks for a beat between minBPM and maxBPM, tempos near expectedBPM are preferred when several beats fit (a half
+# or double tempo fits the same notes)
+# Returns (tempoBPM, confidence, firstBeat), or (None, 0, None) if the onsets are too few or too close to tell
+# confidence is how far the beat's peak stands above the best peak that isn't half or double its tempo (0 to 1),
+# 0 when another tempo fits the onsets about as well
+# firstBeat is the time (ms) of the first beat, at or just before the first onset, to use as startFrame
+def EstimateTempo(noteList, expectedBPM=120, minBPM=60, maxBPM=200, resolution=10, onsetTolerance=40):
+    starts = np.sort(NoteArray(noteList)["start"])
+    if len(starts)==0:
+        return (None, 0.0, None)
+    onsets = starts[np.r_[True, np.diff(starts) > onsetTolerance]]
+    if len(onsets) < 3:
+        return (None, 0.0, None)
+    shortestLag = int(60000/maxBPM/resolution)
+    longestLag = int(math.ceil(60000/minBPM/resolution))
+
+    # Onset train smoothed so onsets a few frames apart still line up
+    positions = np.round((onsets - onsets[0]) / resolution).astype(int)
+    sigma = onsetTolerance/2/resolution
+    kernel = np.exp(-0.5*(np.arange(-3*int(sigma+1), 3*int(sigma+1)+1)/sigma)**2)
+    train = np.convolve(np.bincount(positions), kernel)
+    length = len(train)
+    if longestLag >= length-1:
+        longestLag = length-2
+    if longestLag <= shortestLag:
+        return (None, 0.0, None)
+
+    # Autocorrelation by FFT, divided by the overlap at each lag so long lags aren't penalized
+    size = 1 << int(2*length-1).bit_length()
+    spectrum = np.fft.rfft(train, size)
+    correlation = np.fft.irfft(spectrum*np.conj(spectrum), size)[:length]
+    correlation = correlation / (length - np.arange(length)) * length / correlation[0]
+
+    lags = np.arange(shortestLag, longestLag+1)
+    preference = np.exp(-0.5*np.log2(60000/(lags*resolution)/expectedBPM)**2) # Falls off over an octave
+    scores = correlation[lags]*preference
+    best = int(np.argmax(scores))
+    lag = lags[best]
+
+    # Confidence is the margin of the beat over the best competing peak, lags a power of two away from the beat
+    # (half or double tempo) play the same beats and don't compete
+    # It is also kept below how far the beat stands above the typical lag, so onsets without a beat get little
+    peaks = np.flatnonzero((scores >= np.roll(scores, 1)) & (scores >= np.roll(scores, -1)))
+    octaves = np.log2(lags[peaks]/lag)
+    competing = np.abs(octaves - np.round(octaves)) > 0.09 # More than about a sixteenth of the lag away
+    competitor = scores[peaks[competing]].max() if competing.any() else 0.0
+    salience = 1 - np.median(correlation[lags])/correlation[lag]
+    confidence = float(np.clip(min(1 - competitor/scores[best], salience), 0, 1)) if scores[best] > 0 else 0.0
+
+    # Refines the beat from the peaks at its whole multiples, up to half the onset train
+    # Each peak is looked for around the multiple of the beat refined so far, closer than the sixteenth notes
+    beatLag, weightedPeaks, squares = float(lag), 0.0, 0
+    for multiple in range(1, length//2//lag+1):
+        center = int(round(multiple*beatLag))
+        low, high = center - max(1, lag//8), center + max(1, lag//8) + 1
+        if high >= length-1:
+            break
+        peak = low + int(np.argmax(correlation[low:high]))
+        left, middle, right = correlation[peak-1:peak+2] # Parabolic interpolation between the neighbouring lags
+        curvature = left - 2*middle + right
+        peak = peak + (min(0.5, max(-0.5, 0.5*(left-right)/curvature)) if curvature<0 else 0) # Half a lag at the window edges
+        weightedPeaks += multiple*peak
+        squares += multiple*multiple
+        beatLag = weightedPeaks/squares # Least squares through the origin
+    beatLength = beatLag*resolution
+
+    # Phase of the beats from the mean angle of the onsets around the beat, between -beatLength/2 and beatLength/2
+    # then the beat and phase are fitted to the onsets placed on the nearest sixteenth note
+    times = onsets - onsets[0]
+    phase = float(np.angle(np.exp(2j*np.pi*times/beatLength).sum()))/(2*np.pi)*beatLength
+    for _ in range(2):
+        sixteenths = np.round((times - phase)/(beatLength/4))
+        slope, phase = np.polyfit(sixteenths, times, 1)
+        beatLength = 4*float(slope)
+    firstBeat = onsets[0] + phase + beatLength*math.floor((beatLength/8 - phase)/beatLength)
+    return (60000/beatLength, confidence, float(firstBeat))
+
+# Returns (tempo, startFrame) used to translate noteList, startFrame None starts at the first note
+# autoTempo uses EstimateTempo unless its confidence is below minConfidence, then tempo is used as given
+# tempo is also the expected tempo of the estimate, a rough guess is enough to pick between half and double tempo
+# Adds the estimate to stats if it is given
+def ChooseTempo(noteList, tempo, autoTempo=False, minConfidence=0.15, stats=None):
+    if not autoTempo:
+        return (tempo, None)
+    estimatedTempo, confidence, firstBeat = EstimateTempo(noteList, tempo)
+    if stats is not None:
+        stats["estimatedTempo"], stats["tempoConfidence"], stats["firstBeat"] = estimatedTempo, confidence, firstBeat
+    if estimatedTempo is None or confidence < minConfidence:
+        return (tempo, None)
+    return (estimatedTempo, firstBeat)
+
 # Takes (noteIndex, startTime, endTime) array
-# Converts to (noteIndex, starting beat number, beat duration) in terms of quarter notes
+# Converts to (noteIndex, starting beat number, beat duration) in terms of quarter notes, as a BEAT_DTYPE array
+# Beats count from startFrame (ms), or from the start of the first note in noteList if startFrame is None
 def NoteTranslation(noteList, tempoLength, startFrame):
-    
-    beatList = []
-    startFrame = noteList[0][1]
+    notes = NoteArray(noteList)
+    if startFrame is None:
+        startFrame = notes["start"][0]
 
     baseLength = tempoLength/4 # Length of signle beat, turned to length of sixteenth note
     print(tempoLength)
     print(baseLength)
     print("start")
-    
-    for i in range(len(noteList)):
-        # Translate note name
-        # noteName = sharpNames[noteList[i][0]%12]
-
-        # Round note start to 16th note
-        noteStart = noteList[i][1] - startFrame
-        noteStartRounded = round(noteStart / baseLength) / 4
-
-        # Round note length to 16th note
-        noteLength = (noteList[i][2]-noteList[i][1])
-        noteLengthRounded = math.ceil(noteLength / baseLength) / 4
 
-        beatList.append([noteList[i][0],noteStartRounded,noteLengthRounded])
-
-    
-    noteList2=[]
-    for i in range(len(noteList)):
-        noteList2.append((noteList[i][0],round(noteList[i][1],2),round(noteList[i][2],2),beatList[i][0],beatList[i][1],beatList[i][2]))
-
-    '''
-    for note in noteList2:
-        print(note)
-    '''
+    beatList = np.empty(len(notes), BEAT_DTYPE)
+    beatList["key"] = notes["key"]
+    # Round note start to 16th note (np.round rounds halves to even like round)
+    beatList["start"] = np.round((notes["start"] - startFrame) / baseLength) / 4
+    # Round note length to 16th note
+    beatList["length"] = np.ceil((notes["end"] - notes["start"]) / baseLength) / 4
     return beatList
 
 # Writes XML intro to output
@@ -187,7 +1200,7 @@ def CreateXmlIntro(output,name, author):
         output.write(line+"\n")
 
 # Writes XML attributes (for measure 1) to output
-def CreateXmlAttributes(output,sharpIndex):
+def CreateXmlAttributes(output,sharpIndex,timeSig=(4,4)):
     attr = [ 
         '      <attributes>',
         '        <divisions>8</divisions>',
@@ -196,8 +1209,8 @@ def CreateXmlAttributes(output,sharpIndex):
         '          <mode>major</mode>',
         '        </key>',
         '        <time>',
-        '          <beats>4</beats>',
-        '          <beat-type>4</beat-type>',
+        '          <beats>'+str(timeSig[0])+'</beats>',
+        '          <beat-type>'+str(timeSig[1])+'</beat-type>',
         '        </time>',
         '        <staves>2</staves>',
         '        <clef number="1">',
@@ -224,6 +1237,26 @@ def CreateXmlEnd(output):
 
 # Converts note to XML, writes note to output
 def CreateXmlNote(output,note,staff,noteNames):
+    output.write(XmlNote(note,staff,noteNames))
+
+# Converts note to XML, returns the XML lines as one string
+# Built from fragments that each depend on a few fields of the note, so ScoreWriter can reuse them
+def XmlNote(note,staff,noteNames):
+    return (XmlNoteBackup(note[2]) + XmlNotePitch(note[0],note[2]==-1,noteNames) +
+            XmlNoteDuration(note[1],note[4],staff) + XmlNoteNotations(note[3],note[0],noteNames))
+
+# Backup for notes that start between other notes (takeback>0), opens the note
+def XmlNoteBackup(takeback):
+    xmlNotes = []
+    if(takeback>0): # Backup for notes that start between other notes
+        xmlNotes.append('      <backup>')
+        xmlNotes.append('        <duration>'+str(int(round(takeback*8,0)))+'</duration>')
+        xmlNotes.append('      </backup>')
+    xmlNotes.append('      <note>')
+    return "".join(line+"\n" for line in xmlNotes)
+
+# Rest, chord and pitch of a note (noteIndex -1 is a rest)
+def XmlNotePitch(noteIndex,chord,noteNames):
     xmlNotes = []
 
     # Find note pitch
@@ -231,37 +1264,20 @@ def CreateXmlNote(output,note,staff,noteNames):
     flatBases = ["A","Bb","B","C","Db","D","Eb","E","F","Gb","G","Ab"]
     sharpBool = True if noteNames[1][0]=="A" else False
 
-    # Converts XML duration to note type (True if note type is dotted)
-    XmlNoteDict = {1:("32nd",False), 2:("16th",False), 3:("16th",True),4:("eighth",False), 6:("eighth",True), 
-                    8:("quarter",False),12:("quarter",True),16:("half",False),24:("half",True),32:("whole",False)}
-
-    rest = (note[0]==-1)
+    rest = (noteIndex==-1)
     
-    noteName = noteNames[note[0]%12] # Pitch displayed on music
+    noteName = noteNames[noteIndex%12] # Pitch displayed on music
     step = noteName[0]
-    accidental = noteName[1] if len(noteName)==2 else None
 
     if sharpBool:
-        noteBase = sharpBases[note[0]%12] # Actual pitch
+        noteBase = sharpBases[noteIndex%12] # Actual pitch
         alter = 0 if len(noteBase)==1 else 1
     else:
-        noteBase = flatBases[note[0]%12] # Actual pitch
+        noteBase = flatBases[noteIndex%12] # Actual pitch
         alter = 0 if len(noteBase)==1 else -1
     
-    octave = math.floor((note[0]+9)/12)
-    voice = note[4]
+    octave = math.floor((noteIndex+9)/12)
 
-    # Find note type
-    duration = note[1]*8
-    noteType, dotted = XmlNoteDict[note[1]*8]
-    chord = (note[2]==-1)
-    
-    if(note[2]>0): # Backup for notes that start between other notes
-        xmlNotes.append('      <backup>')
-        xmlNotes.append('        <duration>'+str(int(round(note[2]*8,0)))+'</duration>')
-        xmlNotes.append('      </backup>')
-
-    xmlNotes.append('      <note>')
     if (rest): # Sets note type to rest
         xmlNotes.append('        <rest/>')
     else:
@@ -273,6 +1289,15 @@ def CreateXmlNote(output,note,staff,noteNames):
         xmlNotes.append('          <alter>'+str(alter)+'</alter>')
         xmlNotes.append('          <octave>'+str(octave)+'</octave>')
         xmlNotes.append('        </pitch>')
+    return "".join(line+"\n" for line in xmlNotes)
+
+# Duration, voice, type and staff of a note lasting beatLength quarter notes
+def XmlNoteDuration(beatLength,voice,staff):
+    xmlNotes = []
+
+    # Find note type
+    duration = beatLength*8
+    noteType, dotted = XML_NOTE_TYPES[beatLength*8]
 
     xmlNotes.append('        <duration>'+str(int(round(duration)))+'</duration>')
     xmlNotes.append('        <voice>'+str(voice)+'</voice>')
@@ -282,13 +1307,21 @@ def CreateXmlNote(output,note,staff,noteNames):
     if(dotted): 
         xmlNotes.append('        <dot/>')
     xmlNotes.append('        <staff>'+str(staff)+'</staff>')
+    return "".join(line+"\n" for line in xmlNotes)
+
+# Notations for accidentals & ties, closes the note
+def XmlNoteNotations(tied,noteIndex,noteNames):
+    xmlNotes = []
+
+    noteName = noteNames[noteIndex%12] # Pitch displayed on music
+    accidental = noteName[1] if len(noteName)==2 else None
 
     # Includes notations for accidentals & ties
-    if(note[3] or accidental):
+    if(tied or accidental):
         xmlNotes.append('        <notations>')
-        if(note[3]=="stop" or note[3]=="continue"):
+        if(tied=="stop" or tied=="continue"):
             xmlNotes.append('          <tied type="stop"/>')
-        if(note[3]=="start" or note[3]=="continue"):
+        if(tied=="start" or tied=="continue"):
             xmlNotes.append('          <tied type="start"/>')
         if(accidental=="N"):
             xmlNotes.append('          <accidental-mark>natural</accidental-mark>')
@@ -299,141 +1332,180 @@ def CreateXmlNote(output,note,staff,noteNames):
         xmlNotes.append('        </notations>')
 
     xmlNotes.append('      </note>')
-
-    for line in xmlNotes:
-        output.write(line+"\n")
+    return "".join(line+"\n" for line in xmlNotes)
 
 # Splits beat list into arrays for leftHand and rightHand
 def SplitHands(beatList):
-    leftHand =[]
-    rightHand = []
-
-    for beat in beatList: # Splits based on middle C
-        if(beat[0]>=39):
-            rightHand.append(beat)
-        else:
-            leftHand.append(beat)
-
-    return (leftHand,rightHand)
-
-# Splits beats into appropriate lengths (5 beats = quarter note + eight note)
-def SplitBeats(beatInfo):
-    beatCount = beatInfo[1]*8
-
-    # Converts XML duration to note type (True if note type is dotted)
-    XmlNoteDict = {1:("32nd",False), 2:("16th",False), 3:("16th",True),4:("eighth",False), 6:("eighth",True), 
-                    8:("quarter",False),12:("quarter",True),16:("half",False),24:("half",True),32:("whole",False)}
-
-    if beatCount in XmlNoteDict:
-        return [list(beatInfo)]
-
-    beatValues = list(XmlNoteDict.keys())
-    beatValues.sort(reverse=True)
-
+    rightMask = beatList["key"]>=39 # Splits based on middle C
+    return (beatList[~rightMask], beatList[rightMask])
+
+# Sorts beats by start time, then beat length, then note ascending
+def SortBeats(beats):
+    return beats[np.lexsort((beats["key"], beats["length"], beats["start"]))]
+
+# Converts XML duration (32nd notes) to note type (True if note type is dotted)
+XML_NOTE_TYPES = {1:("32nd",False), 2:("16th",False), 3:("16th",True),4:("eighth",False), 6:("eighth",True), 
+                  8:("quarter",False),12:("quarter",True),16:("half",False),24:("half",True),32:("whole",False)}
+XML_NOTE_VALUES = sorted(XML_NOTE_TYPES, reverse=True)
+
+# Returns the note lengths (quarter notes) a note of beatCount 32nd notes is split into, longest first
+# Each beatCount is only worked out once
+@functools.lru_cache(maxsize=None)
+def BeatBreakdown(beatCount):
     beatBreakdown = []
     while(beatCount>0):
-        if beatCount in beatValues:
+        if beatCount in XML_NOTE_TYPES:
             beatBreakdown.append(beatCount/8)
-            beatCount=0
             break
-        for beatValue in beatValues:
+        for beatValue in XML_NOTE_VALUES:
             if beatValue<=beatCount:
                 beatCount-=beatValue
                 beatBreakdown.append(beatValue/8)
                 break
+    return tuple(beatBreakdown)
+
+# Splits beats into appropriate lengths (5 beats = quarter note + eight note)
+# Returns the measure entries as tuples
+def SplitBeats(beatInfo):
+    beatCount = beatInfo[1]*8
+
+    if beatCount in XML_NOTE_TYPES:
+        return [tuple(beatInfo)]
+
+    beatBreakdown = BeatBreakdown(beatCount)
 
     newBeats = []
     for i in range(len(beatBreakdown)):
         if i==0:
-            if(beatInfo[3]=="stop"): # Slur started in previous measure
-                newBeats.append([beatInfo[0],beatBreakdown[i],beatInfo[2],"continue",beatInfo[4]])
+            if(beatInfo[3]=="stop" or beatInfo[3]=="continue"): # Slur started in previous measure
+                newBeats.append((beatInfo[0],beatBreakdown[i],beatInfo[2],"continue",beatInfo[4]))
             else: # Start tied
-                newBeats.append([beatInfo[0],beatBreakdown[i],beatInfo[2],"start",beatInfo[4]])
+                newBeats.append((beatInfo[0],beatBreakdown[i],beatInfo[2],"start",beatInfo[4]))
         else:
-            if(i==len(beatBreakdown)-1 and beatInfo[3]!="start"): # Slur contained in measure
-                newBeats.append([beatInfo[0],beatBreakdown[i],0,"stop",beatInfo[4]])
+            if(i==len(beatBreakdown)-1 and beatInfo[3]!="start" and beatInfo[3]!="continue"): # Slur contained in measure
+                newBeats.append((beatInfo[0],beatBreakdown[i],0,"stop",beatInfo[4]))
             else:
-                newBeats.append([beatInfo[0],beatBreakdown[i],0,"continue",beatInfo[4]]) # Slur continues (beyond measure)
+                newBeats.append((beatInfo[0],beatBreakdown[i],0,"continue",beatInfo[4])) # Slur continues (beyond measure)
     
     return newBeats
 
+# Length of a measure in quarter notes
+def MeasureLength(timeSig):
+    return timeSig[0]*4/timeSig[1]
+
 # Converts (noteIndex, starting beat number, beat duration) to list of measures
 # Each measure contains entries of (noteIndex, beat duration, takeback, ties, voice)
 def BeatTranslation(beatList, timeSig, measureCount, voiceBase):
-
-    measures = [[] for _ in range(measureCount)] # Measures that will be returned
-    measureBeats = [[] for _ in range(measureCount)]
-
-    beatsFilled = [0] * measureCount # Non-empty beats at measure i
-    beatsAt = [0] * measureCount # Current pointer for beats at measure i
-    voiceGen = 0
-    voice = voiceBase
-  
-    # Adds each entry to corresponding measures
-    for beat in beatList:
-        measureNum = math.floor(beat[1]//timeSig[0]) # Measure number
-        beatNum = beat[1]%(timeSig[0]) # Beat number
+    builder = MeasureBuilder(timeSig, measureCount, voiceBase)
+    for beat in IterRecords(beatList) if isinstance(beatList, np.ndarray) else beatList:
+        builder.Add(beat)
+    return builder.Advance(measureCount) # Measures that will be returned
+
+# Builds the measures of one hand from beats added in order of starting beat, see BeatTranslation
+# A measure is held only until Advance is told no later beat starts in or before it, or while notes are tied into it
+class MeasureBuilder:
+    def __init__(self, timeSig, measureCount, voiceBase):
+        self.measureLength = MeasureLength(timeSig) # Quarter notes per measure
+        self.measureCount = measureCount
+        self.voiceBase = voiceBase
+        self.measures = {} # Measures that are not finished yet
+        self.beatsAt = {} # Current pointer for beats at measure i
+        self.voiceGen = 0
+        self.voice = voiceBase
+        self.nextMeasure = 0 # First measure that is not finished
+        self.lastVoice = voiceBase # Voice of the last entry of the last finished measure
+
+    # Measure numbers are list indices, negative numbers count back from the last measure
+    def Index(self, measureNum):
+        index = measureNum + self.measureCount if measureNum < 0 else measureNum
+        if not 0 <= index < self.measureCount:
+            raise IndexError("Measure "+str(measureNum)+" is outside the "+str(self.measureCount)+" measures of the score")
+        return index
+
+    # Adds one beat, beats must be added in order of starting beat
+    def Add(self, beat):
+        measureLength = self.measureLength
+        measures, beatsAt = self.measures, self.beatsAt
+        measureNum = math.floor(beat[1]//measureLength) # Measure number
+        beatNum = beat[1]%(measureLength) # Beat number
+        index = self.Index(measureNum)
+        measures.setdefault(index, [])
+        beatsAt.setdefault(index, 0)
         takeback, tied = 0, None
 
         # Check if rests need to be inserted
-        if beatNum>beatsAt[measureNum]: 
-            measures[measureNum].extend(SplitBeats((-1,beatNum-beatsAt[measureNum],0,None,voice)))
-            beatsAt[measureNum]=beatNum
-        
+        if beatNum>beatsAt[index]:
+            measures[index].extend(SplitBeats((-1,beatNum-beatsAt[index],0,None,self.voice)))
+            beatsAt[index]=beatNum
+
         # Check if need to insert takeback because pointer too far ahead
-        if beatNum<beatsAt[measureNum]:
-            takeback = beatsAt[measureNum] - beatNum 
+        if beatNum<beatsAt[index]:
+            takeback = beatsAt[index] - beatNum
             # ALPHA: Might mess up slurs between measures
             # Check if takeback is same as note length, note length same as prev note length
-            if beat[2]==takeback and (measures[measureNum] and measures[measureNum][-1][1]==takeback): # Increase voice for non-chord overlaps
+            if beat[2]==takeback and (measures[index] and measures[index][-1][1]==takeback): # Increase voice for non-chord overlaps
                 takeback = -1
             else:
-                voiceGen = (voiceGen+1)%4
-                voice = voiceGen+voiceBase # Cycles between five voices starting from voiceBase
+                self.voiceGen = (self.voiceGen+1)%4
+                self.voice = self.voiceGen+self.voiceBase # Cycles between five voices starting from voiceBase
 
         # Check if notes need to be extended to next measure
-        if beatNum + beat[2] > timeSig[0]:
-            extendBeats = beatNum + beat[2] - timeSig[0]
+        if beatNum + beat[2] > measureLength:
+            extendBeats = beatNum + beat[2] - measureLength
             extraMeasureNum = measureNum + 1
             while(extendBeats>0):
-                if extendBeats<=timeSig[0]:
+                if extendBeats<=measureLength:
                     tied = "stop"
                 else:
                     tied = "continue"
-                measures[extraMeasureNum].extend(SplitBeats((beat[0],min(4,extendBeats),beatsAt[extraMeasureNum], tied, voice)))
+                extraIndex = self.Index(extraMeasureNum)
+                measures.setdefault(extraIndex, [])
+                beatsAt.setdefault(extraIndex, 0)
+                measures[extraIndex].extend(SplitBeats((beat[0],min(measureLength,extendBeats),beatsAt[extraIndex], tied, self.voice)))
 
-                beatsFilled[extraMeasureNum] = max(beatsFilled[extraMeasureNum],extendBeats)
-                beatsAt[extraMeasureNum] = min(4,extendBeats)
-                extendBeats -= min(4,extendBeats)
+                beatsAt[extraIndex] = min(measureLength,extendBeats)
+                extendBeats -= min(measureLength,extendBeats)
                 extraMeasureNum += 1
-            voiceGen = (voiceGen+1)%4
-            voice = voiceGen+voiceBase # Cycles between five voices starting from voiceBase
+            self.voiceGen = (self.voiceGen+1)%4
+            self.voice = self.voiceGen+self.voiceBase # Cycles between five voices starting from voiceBase
 
         # Add notes to measure
-        if beatNum+beat[2]>timeSig[0]: # Extends past measureNum
-            tied = "start"
-            measures[measureNum].extend(SplitBeats((beat[0],timeSig[0]-beatNum,takeback,"start", voice)))
+        if beatNum+beat[2]>measureLength: # Extends past measureNum
+            measures[index].extend(SplitBeats((beat[0],measureLength-beatNum,takeback,"start", self.voice)))
         else: # Doesn't extend past measureNum
-            measures[measureNum].extend(SplitBeats((beat[0],beat[2],takeback,tied, voice)))
-
-        beatsFilled[measureNum]=min(max(beatNum+beat[2],beatsFilled[measureNum]),timeSig[0])
-        beatsAt[measureNum]=min(beatNum+beat[2],timeSig[0])
-        measureBeats[measureNum].append(beat)
-    
-    for i in range(len(measures)):
-        if beatsAt[i] < timeSig[0]:
-            if measures[i]:
-                lastVoice = measures[i][-1][4]
-            elif i==0:
-                lastVoice = voiceBase
-            else:
-                lastVoice = measures[i-1][-1][4]
-            measures[i].extend(SplitBeats((-1,timeSig[0]-beatsAt[i],0,None,lastVoice)))
-    return measures
+            measures[index].extend(SplitBeats((beat[0],beat[2],takeback,tied, self.voice)))
+
+        beatsAt[index]=min(beatNum+beat[2],measureLength)
+
+    # Finishes the measures before measureNum, fills them with rests and returns them in order
+    def Advance(self, measureNum):
+        finished = []
+        while self.nextMeasure < min(measureNum, self.measureCount):
+            i = self.nextMeasure
+            measure = self.measures.pop(i, [])
+            beatsAt = self.beatsAt.pop(i, 0)
+            if beatsAt < self.measureLength:
+                if measure:
+                    lastVoice = measure[-1][4]
+                elif i==0:
+                    lastVoice = self.voiceBase
+                else:
+                    lastVoice = self.lastVoice
+                measure.extend(SplitBeats((-1,self.measureLength-beatsAt,0,None,lastVoice)))
+            self.lastVoice = measure[-1][4]
+            finished.append(measure)
+            self.nextMeasure += 1
+        return finished
 
 # Converts measures into XML, writes to output
 def CreateXmlMeasures(output,leftHandBeats,rightHandBeats, sharpIndex, timeSig):
+    writer = ScoreWriter(output, sharpIndex, timeSig)
+    for measureNum in range(len(leftHandBeats)):
+        writer.Measure(rightHandBeats[measureNum], leftHandBeats[measureNum])
 
+# Returns the pitch names written for the 12 notes starting at A in the key with sharpIndex sharps (flats if negative)
+# Names ending in N get a natural sign, names with # or b get an accidental sign
+def KeyNoteNames(sharpIndex):
     sharpArray = ["F","C","G","D","A","E","B"]
     sharpBases = ["A","A#","B","C","C#","D","D#","E","F","F#","G","G#"]
     flatBases = ["A","Bb","B","C","Db","D","Eb","E","F","Gb","G","Ab"]
@@ -461,36 +1533,184 @@ def CreateXmlMeasures(output,leftHandBeats,rightHandBeats, sharpIndex, timeSig):
                     newNoteNames.append(noteName[0])
             else:
                 newNoteNames.append(noteName)
-
-
-    # Create measure
-    for measureNum in range(len(leftHandBeats)):
-
-        output.write('    <measure number="'+str(measureNum+1)+'">\n') 
-
-        # Add attributes (clef, time signature, etc.) for first measure
-        if (measureNum==0):
-            CreateXmlAttributes(output,sharpIndex)
-
-        # Write right hand notes
-        for note in rightHandBeats[measureNum]:
-            CreateXmlNote(output,note,1,newNoteNames)
-        
+    return newNoteNames
+
+# Writes measures to output one at a time, numbered from 1, with the attributes in the first measure
+# Note XML is joined from fragments built once per pitch, duration, takeback and tie, see XmlNote
+# Each measure is joined and written with one write
+class ScoreWriter:
+    def __init__(self, output, sharpIndex, timeSig):
+        self.output = output
+        self.sharpIndex = sharpIndex
+        self.timeSig = timeSig
+        self.noteNames = KeyNoteNames(sharpIndex)
+        self.backups, self.pitches, self.durations, self.notations = {}, {}, {}, {} # Fragments built so far
+        self.measureNum = 0
         # Backup to write left hand notes
-        output.write('      <backup>\n')
-        output.write('        <duration>'+str(int(round(timeSig[0]*8)))+'</duration>\n')
-        output.write('      </backup>\n')
-
-        # Write left hand notes
-        for note in leftHandBeats[measureNum]:
-            CreateXmlNote(output,note,2,newNoteNames)
-
-        output.write('    </measure>\n')     
+        self.backup = '      <backup>\n        <duration>'+str(int(round(MeasureLength(timeSig)*8)))+'</duration>\n      </backup>\n'
+
+    def Note(self, note, staff):
+        backup = self.backups.get(note[2])
+        if backup is None:
+            backup = self.backups[note[2]] = XmlNoteBackup(note[2])
+        pitchKey = (note[0], note[2]==-1)
+        pitch = self.pitches.get(pitchKey)
+        if pitch is None:
+            pitch = self.pitches[pitchKey] = XmlNotePitch(note[0], note[2]==-1, self.noteNames)
+        durationKey = (note[1], note[4], staff)
+        duration = self.durations.get(durationKey)
+        if duration is None:
+            duration = self.durations[durationKey] = XmlNoteDuration(note[1], note[4], staff)
+        notationsKey = (note[3], note[0]%12)
+        notations = self.notations.get(notationsKey)
+        if notations is None:
+            notations = self.notations[notationsKey] = XmlNoteNotations(note[3], note[0], self.noteNames)
+        return backup+pitch+duration+notations
+
+    def Measure(self, rightNotes, leftNotes):
+        self.measureNum += 1
+        self.output.write('    <measure number="'+str(self.measureNum)+'">\n')
 
-def process(filename, outputName, keyFrame, lastFrame, tempo, key, 
-            title, composer, noteThreshold):
+        # Add attributes (clef, time signature, etc.) for first measure
+        if self.measureNum==1:
+            CreateXmlAttributes(self.output,self.sharpIndex,self.timeSig)
+
+        parts = [self.Note(note,1) for note in rightNotes] # Right hand notes
+        parts.append(self.backup)
+        parts.extend(self.Note(note,2) for note in leftNotes) # Left hand notes
+        parts.append('    </measure>\n')
+        self.output.write("".join(parts))
+
+# Builds and writes the measures of both hands as soon as no later beat can change them
+# Both hands are BEAT_DTYPE arrays sorted by starting beat, only measures with notes tied into them are held ahead
+# instruments - Optional Instrumentation, times building measures (measures) apart from writing them (xml)
+def WriteMeasures(output, leftHand, rightHand, sharpIndex, timeSig, measureCount, instruments=None):
+    if instruments is None:
+        instruments = NO_INSTRUMENTS
+    writer = ScoreWriter(output, sharpIndex, timeSig)
+    rightBuilder = MeasureBuilder(timeSig, measureCount, 1)
+    leftBuilder = MeasureBuilder(timeSig, measureCount, 1)
+    hands = heapq.merge(((rightBuilder, beat) for beat in IterRecords(rightHand)),
+                        ((leftBuilder, beat) for beat in IterRecords(leftHand)), key=lambda item: item[1][1])
+
+    xmlSeconds = instruments.seconds.get("xml", 0.0)
+    startTime = time.perf_counter()
+    for builder, beat in hands:
+        measureNum = math.floor(beat[1]//MeasureLength(timeSig)) # Later beats don't start before this measure
+        for rightMeasure, leftMeasure in zip(rightBuilder.Advance(measureNum), leftBuilder.Advance(measureNum)):
+            with instruments.Stage("xml"):
+                writer.Measure(rightMeasure, leftMeasure)
+        builder.Add(beat)
+    for rightMeasure, leftMeasure in zip(rightBuilder.Advance(measureCount), leftBuilder.Advance(measureCount)):
+        with instruments.Stage("xml"):
+            writer.Measure(rightMeasure, leftMeasure)
+    if instruments.enabled: # Timed per beat would cost more than building the measure, so it is the time outside xml
+        instruments.Add("measures", time.perf_counter() - startTime - (instruments.seconds.get("xml", 0.0) - xmlSeconds))
+
+# Builds and writes measures from notes as they are read, for TranscribeStream
+# Notes can be added in any order as long as none starts before the horizon Advance was last given
+# Measures are translated like CreateScore with startFrame at firstBeat, one hand per MeasureBuilder
+# A note that starts before firstBeat moves firstBeat back by whole measures while no measure is written yet (a pickup),
+# once measures are written such a note can't be placed and is dropped, counted in dropped
+class LiveScore:
+    def __init__(self, tempo, sharpIndex, timeSig, firstBeat=None):
+        self.baseLength = 60000/tempo/4 # Length of a sixteenth note
+        self.measureLength = MeasureLength(timeSig)
+        self.timeSig = timeSig
+        self.firstBeat = firstBeat # Set by the first note added if None
+        self.output = io.StringIO()
+        self.writer = ScoreWriter(self.output, sharpIndex, timeSig)
+        self.notes = [] # Notes added before the first measure is written, rebuilt if firstBeat moves back
+        self.dropped = 0
+        self.Restart(firstBeat)
+
+    # Empties the measures not written yet and measures them from firstBeat
+    def Restart(self, firstBeat):
+        self.firstBeat = firstBeat
+        self.builders = (MeasureBuilder(self.timeSig, math.inf, 1), MeasureBuilder(self.timeSig, math.inf, 1)) # Left, right hand
+        self.pending = ([], []) # Heaps of (starting beat, beat duration, noteIndex) not built yet, sorted like SortBeats
+        self.lastBeat = 0 # End of the latest beat in quarter notes
+
+    # Adds a finished note (noteIndex, startTime, endTime)
+    def AddNote(self, note):
+        if self.firstBeat is None:
+            self.firstBeat = note[1]
+        start = round((note[1] - self.firstBeat) / self.baseLength) / 4 # Rounded like NoteTranslation
+        if start < 0: # Starts before measure 1
+            if self.writer.measureNum > 0:
+                self.dropped += 1
+                return
+            notes = self.notes
+            self.notes = []
+            self.Restart(self.firstBeat - 4*self.baseLength*self.measureLength*math.ceil(-start/self.measureLength))
+            for earlier in notes:
+                self.AddNote(earlier)
+            start = round((note[1] - self.firstBeat) / self.baseLength) / 4
+        if self.writer.measureNum == 0:
+            self.notes.append(note)
+        length = math.ceil((note[2] - note[1]) / self.baseLength) / 4
+        heapq.heappush(self.pending[1 if note[0]>=39 else 0], (start, length, note[0]))
+        self.lastBeat = max(self.lastBeat, start+length)
+
+    # Returns (measureNum, measure XML) of the measures that no note starting at or after horizon (ms) can change
+    # Empty measures after the last note wait for the next note, so silence at the end isn't written
+    def Advance(self, horizon):
+        if self.firstBeat is None:
+            return []
+        ready = math.floor((horizon - self.firstBeat) / self.baseLength) / 4 # Later notes round to this beat or later
+        return self.Flush(ready, min(math.floor(ready//self.measureLength), math.ceil(self.lastBeat/self.measureLength)))
+
+    # Returns the remaining measures once no more notes will be added
+    def Finish(self):
+        return self.Flush(math.inf, math.ceil(self.lastBeat/self.measureLength))
+
+    def Flush(self, ready, measureNum):
+        for builder, pending in zip(self.builders, self.pending):
+            while pending and pending[0][0] < ready:
+                start, length, noteIndex = heapq.heappop(pending)
+                builder.Add((noteIndex, start, length))
+        leftMeasures, rightMeasures = [builder.Advance(measureNum) for builder in self.builders]
+        measures = []
+        for rightMeasure, leftMeasure in zip(rightMeasures, leftMeasures):
+            self.writer.Measure(rightMeasure, leftMeasure)
+            measures.append((self.writer.measureNum, self.output.getvalue()))
+            self.output.seek(0)
+            self.output.truncate()
+        if measures:
+            self.notes = [] # firstBeat can't move anymore
+        return measures
+
+# debugMode, debugEvery, debugVideo - Debug image output, see DebugWriter (off by default)
+# threads - Detection worker threads fed by a decoder thread, 0 decodes and detects on the calling thread
+# processes - Splits the video into time segments transcribed in a process pool, 0 transcribes in this process
+# calibrationCache - Optional path of a calibration cache file, reuses keyboard calibration from earlier runs
+# intensityFile - Optional .npy path, records per-frame key intensities for processIntensities
+# sweepFile - Optional .npy path, records key intensities for every noteBuffer in sweepBuffers and
+#             noteYRange up to sweepYRange for processSweep
+# frameSource - "capture" reads the note band with cv2.VideoCapture, "ffmpeg" has an ffmpeg subprocess decode only the band
+# stride - Reads every stride-th frame and bisects to find key state changes between them, 1 reads every frame
+#          Notes shorter than stride frames can be missed, needs frameSource="capture" and can't record intensities
+# changeTolerance - Skips detection of frames whose note band differs from the last detected band by at most
+#                   changeTolerance in every pixel, None detects every frame
+# stats - Optional dict, gets the bandHits (detection skipped) and bandMisses (detected) counters
+# progress - Optional function called as progress(timestamp, endFrame) after each frame read in this process,
+#            endFrame is lastFrame or the end of the video if it comes first
+# cancel - Optional event (threading, multiprocessing or Manager) checked after each frame read in this process,
+#          stops the transcription with an exception once set
+# compressed - Writes outputName.mxl (compressed MusicXML) instead of outputName.musicxml
+# timeSig - Time signature of the score as (beats, beat type)
+# autoTempo - Estimates the tempo and first beat from the note onsets (EstimateTempo), tempo is only used
+#             if the estimate's confidence is below minConfidence and otherwise only picks between half and double
+#             tempo. Returns the tempo used, the estimate goes to stats
+# midi - Also writes outputName.mid with the exact note times (see CreateMidi)
+# instruments - Optional Instrumentation, gets stage timings and counters (see main(report=True))
+def process(filename, outputName, keyFrame, startFrame, lastFrame, tempo, key, 
+            title, composer, noteThreshold, debugMode="off", debugEvery=1, debugVideo=None,
+            threads=0, processes=0, calibrationCache=None, intensityFile=None,
+            sweepFile=None, sweepBuffers=(0,1,2,3), sweepYRange=8, frameSource="capture", stride=1,
+            changeTolerance=0, stats=None, progress=None, cancel=None, compressed=False, timeSig=(4,4),
+            autoTempo=False, minConfidence=0.15, midi=False, instruments=None):
 
-    startFrame = keyFrame
     # WEB CHANGE    
     # filename = "static/uploads/"+filename
 
@@ -507,156 +1727,448 @@ def process(filename, outputName, keyFrame, lastFrame, tempo, key,
     noteRow = 200 # Y pos used to calculate notes
     keyGroups = [] # Holds (start x, end x) for 88 notes
     noteList = [] # Holds (note type, start time, end time)
-    noteActive = {} # Dict for which notes were active last frame
+    noteActive = CreateNoteActive() # Start time of notes that were active last frame
 
     keyThreshold = 60 # Threshold for differentiating white/black keys
     keyLength = 5 # Minimum length for white/black key
     noteBuffer = 1 # Pixels on either side of X bounds ignored for note considerations
     noteYRange = 3 # Pixels in Y direction needed to be considered a note
 
-    for i in range(88):
-        noteActive[i]=-1
-
-    # Variables - Image detection start
-    keyFrameActive = True
-
     # Variables - Music characteristics
     tempoLength = 60000/tempo
     measureCount = 0
-    timeSig = [4,4]
 
-    if not os.path.isdir("Frames"):
-        os.makedirs("Frames")
+    if instruments is None:
+        instruments = NO_INSTRUMENTS
+    debug = DebugWriter(debugMode, debugEvery, debugVideo, cap.get(cv2.CAP_PROP_FPS) or 30, instruments=instruments)
+    endFrame = VideoEnd(cap, lastFrame)
+    results = None
+    detector = None
+    record = None
+    timestamps, intensityList, sweepList = [], [], [] # Recorded key intensities
 
-    # Iterating through the frames
-    while (cap.isOpened()):
+    try:
+        if stride>1 and (processes>0 or threads>0 or frameSource!="capture"):
+            raise ValueError("stride needs frameSource=\"capture\" without threads or processes")
+        if stride>1 and (intensityFile is not None or sweepFile is not None):
+            raise ValueError("stride skips frames, intensities can't be recorded")
 
-        ret, frame = cap.read() # ret is false if no frames have been grabbed
-        
-        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
-        if timestamp<keyFrame or (timestamp<startFrame and not keyFrameActive):
-            continue
-            
-        if timestamp > lastFrame:
-            break
+        with instruments.Stage("seek"):
+            ret, frame, timestamp = SeekFrame(cap, keyFrame) # Skips straight to the key frame
 
-        if ret == True: # Frame grabbed
-            
+        # Updates global variables based on measurement from key frame
+        if ret and timestamp <= lastFrame:
             frameBW = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) # Converts frame to black/white
+            height, width, _ = frame.shape
+            calibration = None
+            if calibrationCache is not None:
+                fingerprint = VideoFingerprint(filename, cap, frameBW, keyLength)
+                calibration = LoadCalibration(calibrationCache, fingerprint)
+
+            if calibration is not None: # Skips calibration on re-runs of the same video
+                instruments.Count("calibrationCacheHits")
+                keyGroups, keyRow = calibration["keyGroups"], calibration["keyRow"]
+                keyThreshold, noteRow = calibration["keyThreshold"], calibration["noteRow"]
+            else:
+                with instruments.Stage("calibrate"):
+                    keyGroups, keyRow, keyThreshold = FindKeyboard(frameBW, keyLength, frame, debug, instruments)
+                noteRow = keyRow // 2
+                if calibrationCache is not None:
+                    SaveCalibration(calibrationCache, fingerprint, filename, keyGroups, keyRow, keyThreshold, noteRow)
+            noteColumns = CreateNoteColumns(keyGroups, noteBuffer) # Pixel columns checked for each key
+            sweepColumns = [CreateNoteColumns(keyGroups, sweepBuffer) for sweepBuffer in sweepBuffers]
+            if processes>0: # Segments are read by the process pool instead
+                if debugVideo is not None:
+                    raise ValueError("debugVideo can't be written from several processes")
+                if sweepFile is not None:
+                    raise ValueError("sweepFile can't be recorded from several processes")
+                with instruments.Stage("segments"):
+                    segmentNotes, noteActive, record = TranscribeSegments(filename, max(keyFrame, startFrame), lastFrame, processes, noteRow, keyGroups,
+                                                                          noteBuffer, noteYRange, noteThreshold, debugMode, debugEvery, intensityFile is not None,
+                                                                          frameSource, changeTolerance, stats, instruments)
+                noteList.extend(segmentNotes)
+                ret = False
+            elif timestamp<startFrame:
+                with instruments.Stage("seek"):
+                    ret, frame, timestamp = GrabUntil(cap, startFrame) # Frames before startFrame are not decoded
+
+        # Finds key intensities in the note band, compared against noteThreshold by ClassifyKeys
+        # Also returns the intensities of every sweep setting when recording sweepFile
+        def Detect(item):
+            if item is None: # Band unchanged since the last detected frame
+                return None
+            band = item[0] # Band rows start at noteRow
+            instruments.Count("framesAnalyzed")
+            with instruments.Stage("detect"):
+                intensities = GetKeyIntensities(band, 0, noteColumns, noteYRange)
+                if sweepFile is None:
+                    return (intensities, None)
+                return (intensities, GetSweepIntensities(band, 0, sweepColumns, sweepYRange))
+
+        # Only the note band is read after calibration
+        bandHeight = max(noteYRange, sweepYRange) if sweepFile is not None else noteYRange
+        source = OpenFrameSource(frameSource, filename, cap, noteRow, bandHeight, debug.enabled, instruments)
+        frames = ((timestamp, (band, frame)) for timestamp, band, frame in source.Frames(ret, frame, timestamp, lastFrame))
+        if changeTolerance is not None and stride==1: # Compared in decoding order, before frames reach the workers
+            detector = BandChangeDetector(changeTolerance)
+            def Changed(band):
+                with instruments.Stage("compare"):
+                    return detector.Changed(band)
+            frames = ((timestamp, item if Changed(item[0]) else None) for timestamp, item in frames)
+        if stride>1: # Only frames where the key state changes are read
+            results = StrideFrames(source, ret, frame, timestamp, lastFrame, stride, Detect,
+                                   lambda result: ClassifyKeys(result[0], noteThreshold))
+        elif threads>0:
+            results = PipelineFrames(frames, Detect, threads)
+        else:
+            results = ((timestamp, item, Detect(item)) for timestamp, item in frames)
+
+        # Iterating through the frames
+        for timestamp, item, result in results:
+            if result is not None: # Unchanged frames keep the intensities and key state of the last frame
+                intensities, sweepIntensities = result
+                with instruments.Stage("classify"):
+                    noteArray = ClassifyKeys(intensities, noteThreshold) # Checks which notes are pressed
+                with instruments.Stage("update"):
+                    UpdateNotes(noteList, noteArray, noteActive, timestamp) # Updates noteArray
+                if debug.Sample(noteArray):
+                    with instruments.Stage("debug"):
+                        DrawReader(item[1],noteArray,keyGroups,noteRow,height,timestamp,debug) # Creates debug images
+            timestamps.append(timestamp)
+            if intensityFile is not None:
+                intensityList.append(intensities)
+            if sweepFile is not None:
+                sweepList.append(sweepIntensities)
+
+            if progress is not None:
+                progress(timestamp, endFrame)
+            if cancel is not None and cancel.is_set():
+                raise Exception("Transcription cancelled")
+
+    finally:
+        if results is not None:
+            results.close() # Stops the decoder and workers
+        with instruments.Stage("debugClose"):
+            debug.Close() # Finishes writing debug images
+
+    if stats is not None and detector is not None:
+        detector.AddStats(stats)
+    if detector is not None:
+        instruments.Count("framesSkipped", detector.hits)
+
+    if intensityFile is not None:
+        if record is None:
+            record = IntensityRecord(timestamps, intensityList)
+        SaveIntensities(intensityFile, record)
+    if sweepFile is not None:
+        SaveSweep(sweepFile, timestamps, sweepList, sweepBuffers)
 
-            # Updates global variables based on measurement from key frame
-            if keyFrameActive:
-                height, width, _ = frame.shape
-                # Testing row which keyboard can be read
-                
-                for i in range(1,height//20): 
-                    keyRow = height - 20*i
-                    for j in range(1,60):
-                        keyGroups = CreateKeyGroups(frameBW[keyRow], width, 5*j, keyLength)
-                        #print(str(keyRow)+" "+str(5*j)+" "+str(len(keyGroups)))
-                        
-                        if len(keyGroups)>=50:
-                            DrawKeyGroups(frame,keyGroups,height,5*j,keyRow)
-                            cv2.imwrite("Frames/"+str(len(keyGroups))+" "+str(keyRow)+" "+str(5*j)+".png", frame)
-
-                        if len(keyGroups)==73: # 73 is the length when E-F and B-C read as one key
-                            keyGaps = []
-                            for group in keyGroups:
-                                keyGaps.append(group[1]-group[0])
-                            if (0.5 * keyGaps[0] <= keyGaps[1]) and (keyGaps[1] <= 1.5 *keyGaps[0]):
-                                comboIndexes = [2,6,12,16,22,26,32,36,42,46,52,56,62,66,72]
-                                comboRanges=[]
-                                for comboIndex in comboIndexes[::-1]:
-                                    if math.floor(1.5*(keyGroups[0][1]-keyGroups[0][0])) <= (keyGroups[comboIndex][1]-keyGroups[comboIndex][0]):
-                                        comboLength = (keyGroups[comboIndex][1]-keyGroups[comboIndex][0])//2
-                                        comboRanges.append([keyGroups[comboIndex][0],keyGroups[comboIndex][0]+comboLength])
-                                        comboRanges.append([keyGroups[comboIndex][1]-comboLength,keyGroups[comboIndex][1]])
-                                        keyGroups.pop(comboIndex)
-                
-                                keyGroups.extend(comboRanges)
-                                keyGroups.sort(key=lambda x:x[0])
-        
-                                print("EXTENDED TO"+str(len(keyGroups)))
-                        
-                        if len(keyGroups)==88:
-                            noteRow = keyRow // 2
-                            DrawKeyGroups(frame,keyGroups,height,5*j,keyRow)
-                            cv2.imwrite("Frames/__"+str(len(keyGroups))+" "+str(keyRow)+" "+str(5*j)+".png", frame)
-                            break
-                       
-                    if len(keyGroups)==88:
-                        break
-                
-                if(len(keyGroups)!=88):
-                    raise Exception("Keyboard cannot be read")
-
-                keyFrameActive = False
-                if timestamp<startFrame:
-                    continue
-
-            noteArray = GetNotes(frameBW,noteRow, keyGroups, noteBuffer, noteYRange, noteThreshold) # Checks which notes are pressed
-            UpdateNotes(noteList, noteArray, noteActive, timestamp) # Updates noteArray
-            DrawReader(frame,noteArray,keyGroups,noteRow,height,timestamp) # Creates debug images
-
-            # Press 'q' to terminate
-            if cv2.waitKey(1) & 0xFF == ord('q'): 
-                break
-        
-        else: # No frame grabbed, break
-            break
-
-    
-    tempoLength = 60000/tempo
-    beatList = NoteTranslation(noteList,tempoLength,startFrame) # Translates note list into beat sequence
+    cap.release() # Closes the video file
 
-    measureCount = math.ceil((beatList[-1][1]+beatList[-1][2])/timeSig[0]) # Calculates number of measures
+    instruments.Count("notes", len(noteList))
+    with instruments.Stage("tempo"):
+        tempo, beatStart = ChooseTempo(noteList, tempo, autoTempo, minConfidence, stats)
+    CreateScore(noteList, outputName, tempo, key, title, composer, beatStart, timeSig, compressed, instruments)
+    if midi:
+        CreateMidi(noteList, outputName, tempo, beatStart, timeSig, title, instruments=instruments)
+    return tempo
 
-    leftHand, rightHand = SplitHands(beatList)
-    leftHand.sort(key=lambda x:(x[1],x[2],x[0])) # Sorts by start time, then beat length, then note ascending 
-    rightHand.sort(key=lambda x:(x[1],x[2],x[0])) # Sorts by start time, then beat length, then note ascending 
+# Transcribes a key intensity record written by process (intensityFile) with any noteThreshold
+# Writes outputName.musicxml (or outputName.mxl if compressed) like process without decoding the video again
+# startFrame - Time (ms) of the first beat, None starts at the first note (autoTempo estimates it like process)
+# midi - Also writes outputName.mid (see CreateMidi)
+def processIntensities(intensityFile, outputName, tempo, key, title, composer, noteThreshold, startFrame=None,
+                       compressed=False, timeSig=(4,4), autoTempo=False, minConfidence=0.15, midi=False):
+    noteList, _ = NotesFromIntensities(LoadIntensities(intensityFile), noteThreshold)
+    tempo, beatStart = ChooseTempo(noteList, tempo, autoTempo, minConfidence)
+    if beatStart is None:
+        beatStart = startFrame
+    CreateScore(noteList, outputName, tempo, key, title, composer, beatStart, timeSig, compressed)
+    if midi:
+        CreateMidi(noteList, outputName, tempo, beatStart, timeSig, title)
+    return tempo
 
-    # Translate beat sequences into measure sequences
-    rightHandMeasures = BeatTranslation(rightHand,timeSig,measureCount,1)
-    leftHandMeasures = BeatTranslation(leftHand,timeSig,measureCount,1)
+# Sweeps noteThresholds (and the recorded noteBuffer and noteYRange settings) over a sweep record written by process
+# Returns the SweepSettings report, one entry per setting
+def processSweep(sweepFile, noteThresholds, noteYRanges=None, shortNoteLength=50):
+    record, noteBuffers = LoadSweep(sweepFile)
+    return SweepSettings(record, noteBuffers, noteThresholds, noteYRanges, shortNoteLength)
+
+# Transcribes frames while they are read, frames is any iterator of (timestamp, frame) with BGR frames and timestamps
+# in ms (a pipe, a capture device through CaptureFrames, a generator, ...)
+# Calibrates once on the first frame at or after keyFrame, which has to show the keyboard, and reads notes from frames
+# at or after startFrame with the detection settings of process
+# Yields ("note", noteIndex, startTime, endTime) as soon as a key is released and ("measure", measureNum, xml) as soon as
+# no note still to come can start in the measure, notes still held when frames ends are dropped like in process
+# Measures wait for keys that are held down, so they lag the stream by the longest held note plus a sixteenth note
+# The measures are the <measure> elements of a score, CreateXmlIntro and CreateXmlEnd write the rest of it
+# firstBeat - Time (ms) of the first beat of measure 1, None starts it at the first key pressed
+#             Notes that start before it move it back by whole measures, see LiveScore
+# changeTolerance, instruments - See process
+def TranscribeStream(frames, tempo, key=0, noteThreshold=50, timeSig=(4,4), keyFrame=0, startFrame=0, firstBeat=None,
+                     changeTolerance=0, instruments=None):
+    if instruments is None:
+        instruments = NO_INSTRUMENTS
+    keyLength = 5 # Minimum length for white/black key
+    noteBuffer = 1 # Pixels on either side of X bounds ignored for note considerations
+    noteYRange = 3 # Pixels in Y direction needed to be considered a note
+    score = LiveScore(tempo, key, timeSig, firstBeat)
+    detector = BandChangeDetector(changeTolerance) if changeTolerance is not None else None
+    noteActive = CreateNoteActive()
+    noteColumns = None
+
+    for timestamp, frame in frames:
+        if noteColumns is None: # Not calibrated yet
+            if timestamp < keyFrame:
+                continue
+            with instruments.Stage("calibrate"):
+                keyGroups, keyRow, _ = FindKeyboard(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), keyLength, instruments=instruments)
+            noteRow = keyRow // 2
+            noteColumns = CreateNoteColumns(keyGroups, noteBuffer)
+        if timestamp < startFrame:
+            continue
 
+        instruments.Count("framesDecoded")
+        with instruments.Stage("convert"):
+            band = cv2.cvtColor(frame[noteRow:noteRow+noteYRange], cv2.COLOR_BGR2GRAY)
+        with instruments.Stage("compare"):
+            changed = detector is None or detector.Changed(band)
+        if changed: # Unchanged bands keep the key state of the last frame
+            instruments.Count("framesAnalyzed")
+            with instruments.Stage("detect"):
+                intensities = GetKeyIntensities(band, 0, noteColumns, noteYRange)
+            with instruments.Stage("classify"):
+                noteArray = ClassifyKeys(intensities, noteThreshold)
+            released = []
+            with instruments.Stage("update"):
+                UpdateNotes(released, noteArray, noteActive, timestamp)
+            if score.firstBeat is None and noteArray.any():
+                score.firstBeat = timestamp
+            for note in released:
+                instruments.Count("notes")
+                score.AddNote(note)
+                yield ("note", note[0], note[1], note[2])
+
+        # Keys that are up now can only start on a later frame, keys held down started at their noteActive
+        held = noteActive[noteActive!=-1]
+        with instruments.Stage("measures"):
+            measures = score.Advance(min(timestamp, held.min()) if len(held) else timestamp)
+        for measureNum, xml in measures:
+            yield ("measure", measureNum, xml)
+
+    if noteColumns is not None:
+        for measureNum, xml in score.Finish():
+            yield ("measure", measureNum, xml)
+
+# Yields (timestamp, frame) read from cap for TranscribeStream until the stream ends
+# clock times frames with the monotonic clock from the first frame, for capture devices that report no position
+def CaptureFrames(cap, clock=False):
+    startTime = None
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        if clock:
+            now = time.monotonic()
+            if startTime is None:
+                startTime = now
+            yield ((now-startTime)*1000, frame)
+        else:
+            yield (cap.get(cv2.CAP_PROP_POS_MSEC), frame)
+
+# Translates noteList into measures for both hands and writes outputName.musicxml
+# compressed writes outputName.mxl instead, a MusicXML archive with the score streamed into its only score entry
+# instruments - Optional Instrumentation, times the translate, measures and xml stages and counts measures,
+#               xmlBytes (the MusicXML document) and scoreBytes (the file written)
+def CreateScore(noteList, outputName, tempo, key, title, composer, startFrame, timeSig, compressed=False, instruments=None):
+    if instruments is None:
+        instruments = NO_INSTRUMENTS
+    with instruments.Stage("translate"):
+        tempoLength = 60000/tempo
+        beatList = NoteTranslation(noteList,tempoLength,startFrame) # Translates note list into beat sequence
+
+        measureCount = math.ceil((beatList[-1][1]+beatList[-1][2])/MeasureLength(timeSig)) # Calculates number of measures
+
+        leftHand, rightHand = SplitHands(beatList)
+        leftHand = SortBeats(leftHand)
+        rightHand = SortBeats(rightHand)
+        del beatList
+
+    # Translates beat sequences into measures while writing, to a temporary file so a failed score isn't left behind
     #output = open("/static/outputfile/pianoTranslation.musicxml",'w')
-    output = open(outputName+".musicxml",'w')
+    scorePath = outputName+(".mxl" if compressed else ".musicxml")
+    try:
+        if compressed:
+            with zipfile.ZipFile(scorePath+".tmp", "w", zipfile.ZIP_DEFLATED) as archive:
+                entryName = os.path.basename(outputName)+".musicxml"
+                CreateMxlContainer(archive, entryName)
+                with io.TextIOWrapper(archive.open(entryName, "w"), encoding="utf-8") as output:
+                    CreateXmlScore(output,leftHand,rightHand,key,timeSig,measureCount,title,composer,instruments)
+                xmlBytes = archive.getinfo(entryName).file_size
+        else:
+            with open(scorePath+".tmp",'w',buffering=1<<16) as output:
+                CreateXmlScore(output,leftHand,rightHand,key,timeSig,measureCount,title,composer,instruments)
+            xmlBytes = os.path.getsize(scorePath+".tmp")
+        instruments.Count("measures", measureCount)
+        instruments.Count("xmlBytes", xmlBytes)
+        instruments.Count("scoreBytes", os.path.getsize(scorePath+".tmp"))
+        os.replace(scorePath+".tmp", scorePath)
+    except BaseException:
+        if os.path.exists(scorePath+".tmp"):
+            os.remove(scorePath+".tmp")
+        raise
+
+# Writes the whole score document to output
+def CreateXmlScore(output, leftHand, rightHand, sharpIndex, timeSig, measureCount, title, composer, instruments=None):
     CreateXmlIntro(output,title,composer)
-    CreateXmlMeasures(output,leftHandMeasures,rightHandMeasures,key, timeSig)
+    WriteMeasures(output,leftHand,rightHand,sharpIndex,timeSig,measureCount,instruments)
     CreateXmlEnd(output)
 
-    cap.release() # Closes the video file
-    cv2.destroyAllWindows() # Destroys windows?
-
-    return tempo
-
+# Writes the entries of a compressed MusicXML archive that come before the score entry named entryName
+# The mimetype entry must come first and can't be compressed
+def CreateMxlContainer(archive, entryName):
+    archive.writestr(zipfile.ZipInfo("mimetype"), "application/vnd.recordare.musicxml", zipfile.ZIP_STORED)
+    container = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<container>',
+        '  <rootfiles>',
+        '    <rootfile full-path="'+entryName+'" media-type="application/vnd.recordare.musicxml+xml"/>',
+        '  </rootfiles>',
+        '</container>'
+    ]
+    archive.writestr("META-INF/container.xml", "\n".join(container)+"\n")
+
+MIDI_DIVISION = 480 # Ticks per quarter note
+
+# Writes noteList to outputName.mid, a Standard MIDI File (format 1) with the exact note times, no quantization
+# The first track has the title, tempo and time signature, then one track per hand (right hand from key 39 up, like
+# SplitHands) or a single note track if not splitHands. Key index + 21 is the MIDI pitch
+# tempo - Tempo (BPM) of the tempo event, None writes no tempo event so players use the MIDI default of 120
+# startFrame - Time (ms) of the first beat, None starts at the first note. Notes before it move it back by whole beats
+# Returns the number of bytes written
+def CreateMidi(noteList, outputName, tempo=None, startFrame=None, timeSig=(4,4), title=None, splitHands=True,
+               instruments=None):
+    if instruments is None:
+        instruments = NO_INSTRUMENTS
+    with instruments.Stage("midi"):
+        notes = NoteArray(noteList)
+        beatLength = 60000/(tempo if tempo is not None else 120)
+        origin = startFrame if startFrame is not None else (notes["start"].min() if len(notes) else 0)
+        if len(notes) and notes["start"].min() < origin: # Keeps the first note at or after tick 0
+            origin -= beatLength*math.ceil((origin - notes["start"].min())/beatLength)
+        tickLength = beatLength/MIDI_DIVISION
+
+        conductor = bytearray()
+        if title is not None:
+            conductor += MidiMeta(0x03, title.encode("utf-8"))
+        if tempo is not None:
+            conductor += MidiMeta(0x51, int(round(60000000/tempo)).to_bytes(3, "big"))
+        conductor += MidiMeta(0x58, bytes([timeSig[0], int(math.log2(timeSig[1])), 24, 8]))
+        output = bytearray(b"MThd" + (6).to_bytes(4, "big") + (1).to_bytes(2, "big") +
+                           (3 if splitHands else 2).to_bytes(2, "big") + MIDI_DIVISION.to_bytes(2, "big"))
+        output += MidiTrack(conductor)
+        if splitHands:
+            rightHand = notes["key"] >= 39
+            output += MidiTrack(MidiMeta(0x03, b"Right Hand") + MidiNotes(notes[rightHand], origin, tickLength))
+            output += MidiTrack(MidiMeta(0x03, b"Left Hand") + MidiNotes(notes[~rightHand], origin, tickLength))
+        else:
+            output += MidiTrack(MidiMeta(0x03, b"Piano") + MidiNotes(notes, origin, tickLength))
+
+        midiPath = outputName+".mid"
+        try:
+            with open(midiPath+".tmp", "wb") as midiFile:
+                midiFile.write(output)
+            os.replace(midiPath+".tmp", midiPath)
+        except BaseException:
+            if os.path.exists(midiPath+".tmp"):
+                os.remove(midiPath+".tmp")
+            raise
+    instruments.Count("midiBytes", len(output))
+    return len(output)
+
+# Returns a meta event of type metaType at delta time 0
+def MidiMeta(metaType, data):
+    return bytes([0, 0xFF, metaType]) + MidiVarLen(len(data)) + data
+
+# Returns number as a MIDI variable length quantity, 7 bits per byte with the high bit set on all but the last
+def MidiVarLen(number):
+    data = [number & 0x7F]
+    number >>= 7
+    while number:
+        data.append((number & 0x7F) | 0x80)
+        number >>= 7
+    return bytes(reversed(data))
+
+# Returns a track chunk with events and the end of track event
+def MidiTrack(events):
+    events = bytes(events) + b"\x00\xFF\x2F\x00"
+    return b"MTrk" + len(events).to_bytes(4, "big") + events
+
+# Returns the note on and note off events of notes (structured array of NoteArray) on channel 1, in one numpy pass
+# Notes off are note ons with velocity 0 so a single running status byte covers every event,
+# notes off come before notes on at the same tick so repeated keys retrigger
+def MidiNotes(notes, origin, tickLength):
+    if len(notes) == 0:
+        return b""
+    startTicks = np.round((notes["start"] - origin) / tickLength).astype(np.int64)
+    endTicks = np.maximum(np.round((notes["end"] - origin) / tickLength).astype(np.int64), startTicks+1) # At least a tick
+    ticks = np.concatenate((startTicks, endTicks))
+    pitches = np.concatenate((notes["key"], notes["key"])) + 21
+    velocities = np.repeat(np.array([64, 0], np.uint8), len(notes))
+    order = np.lexsort((velocities > 0, ticks))
+    ticks, pitches, velocities = ticks[order], pitches[order], velocities[order]
+
+    deltas = np.diff(ticks, prepend=0)
+    sizes = 1 + (deltas >= 1<<7) + (deltas >= 1<<14) + (deltas >= 1<<21) # Variable length bytes of each delta
+    eventSizes = sizes + 2
+    eventSizes[0] += 1 # Status byte of the first event
+    ends = np.cumsum(eventSizes)
+    starts = ends - eventSizes
+    data = np.empty(ends[-1], np.uint8)
+    for byte in range(4): # Byte of the delta counted from its last byte
+        has = sizes > byte
+        data[(starts + sizes - 1 - byte)[has]] = ((deltas[has] >> 7*byte) & 0x7F) | (0x80 if byte else 0)
+    data[sizes[0]] = 0x90 # Note on, channel 1
+    data[ends - 2] = pitches
+    data[ends - 1] = velocities
+    return data.tobytes()
+
+# options - Optional keyword arguments passed on to process (debugMode, ...)
+# report - Also returns a JSON serializable report of stage timings and counters, see Instrumentation.Report
+# profileStage - Stage of the report to run under cProfile (read, detect, xml, total, ...), its statistics are added to it
+# Returns (errorMessage, tempo), or (errorMessage, tempo, report) with report
+# tempo is the one the score was written with (estimated with autoTempo)
 def main(filename, outputName, keyFrame, startFrame, lastFrame, tempo, key, 
-            title, composer, noteThreshold):
+            title, composer, noteThreshold, report=False, profileStage=None, **options):
     errorMessage = None       
+    instruments = Instrumentation(profileStage) if report else NO_INSTRUMENTS
     try:
-        process(filename, outputName, keyFrame, startFrame, lastFrame, tempo, key, 
-            title, composer, noteThreshold)
+        with instruments.Stage("total"):
+            tempo = process(filename, outputName, keyFrame, startFrame, lastFrame, tempo, key, 
+                title, composer, noteThreshold, instruments=instruments, **options)
     except Exception as error:
         errorMessage = repr(error)
         print(errorMessage)
 
+    if report:
+        return (errorMessage,tempo,instruments.Report())
     return (errorMessage,tempo)
 
-
-
-#main("pirates.mp4","Test/pirates_translated",5000,5000,30000,140,0,"Pirates","Person",60) # Keyboard not 88
-#main("bee.mp4","Test/bumblebee_translated",4000,4000,20000,188,0,"Flight of the Bumblebee","Person",60) # Can't tell
-#main("id.mp4","Test2/id_translated",1000,1000,60000,77,0,"HMC","???",100) # Piano keyboard can't be read
-#main("dg.mp4","Test2/dg_translated",400,400,90000,129,0,"DG","Fonzi M",20) #Stacattos are tough to pick up
-
-# Works very well
-#main("gurenge.mp4","Test2/gurenge_translated",750,750,90000,135,0,"Gurenge","Fonzi M",50)
-#main("fairy_tail.mp4","Test2/fairy_tail_translated",0,4000,90000,110,0,"Fairy Tail","Anime Song",50)
-#main("fur_elise.mp4","Test2/fur_elise_translated",0,4000,90000,136,0,"Fur Elise","Beethoven",50)
-#main("meglo.mp4","Test2/meglovania_translated",0,4000,60000,120,0,"Meglovania","Toby Fox",50)
-#main("ngnl.mp4","Test2/ngnl_translated",0,4000,60000,147,4,"No Game No Life OP","Anime Song",50)
-#main("coffin_dance.mp4","Test2/cd_translated",0,4000,60000,126,0,"CD","Tetris Song",50)
-
-# Works kinda well
-#main("hmc.mp4","Test2/hmc_translated",6000,6000,60000,152,0,"HMC","???",100)
-main("unravel.mp4","Test2/unravel_translated",0,0,60000,129,0,"Unravel","Animenz",200)
+# Worker processes import this file, so example runs only start from the command line
+if __name__ == "__main__":
+    #main("pirates.mp4","Test/pirates_translated",5000,5000,30000,140,0,"Pirates","Person",60) # Keyboard not 88
+    #main("bee.mp4","Test/bumblebee_translated",4000,4000,20000,188,0,"Flight of the Bumblebee","Person",60) # Can't tell
+    #main("id.mp4","Test2/id_translated",1000,1000,60000,77,0,"HMC","???",100) # Piano keyboard can't be read
+    #main("dg.mp4","Test2/dg_translated",400,400,90000,129,0,"DG","Fonzi M",20) #Stacattos are tough to pick up
+
+    # Works very well
+    #main("gurenge.mp4","Test2/gurenge_translated",750,750,90000,135,0,"Gurenge","Fonzi M",50)
+    #main("fairy_tail.mp4","Test2/fairy_tail_translated",0,4000,90000,110,0,"Fairy Tail","Anime Song",50)
+    #main("fur_elise.mp4","Test2/fur_elise_translated",0,4000,90000,136,0,"Fur Elise","Beethoven",50)
+    #main("meglo.mp4","Test2/meglovania_translated",0,4000,60000,120,0,"Meglovania","Toby Fox",50)
+    #main("ngnl.mp4","Test2/ngnl_translated",0,4000,60000,147,4,"No Game No Life OP","Anime Song",50)
+    #main("coffin_dance.mp4","Test2/cd_translated",0,4000,60000,126,0,"CD","Tetris Song",50)
+
+    # Works kinda well
+    #main("hmc.mp4","Test2/hmc_translated",6000,6000,60000,152,0,"HMC","???",100)
+    main("unravel.mp4","Test2/unravel_translated",0,0,60000,129,0,"Unravel","Animenz",200)
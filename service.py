@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+from batch import Number
+from main import main
+
+# Local HTTP service that transcribes uploaded videos in a process pool
+# Usage: python service.py --port 8000 --workers 2
+#
+# POST   /jobs?title=...&tempo=...   Body is the video, returns the job id right away (202)
+# GET    /jobs/<id>                  Job status and progress as JSON
+# GET    /jobs/<id>/events           Job status as a text/event-stream, one event per update until the job finishes
+# DELETE /jobs/<id>                  Cancels a queued or running job
+# GET    /jobs/<id>/result           Downloads the .musicxml of a finished job
+# Finished jobs and their scores are removed expiry seconds after they finish
+# A worker that dies fails the jobs in the pool with it, the pool is replaced so later jobs still run
+
+# Query parameters of POST /jobs and their defaults, startFrame defaults to keyFrame
+JOB_PARAMETERS = {"keyFrame": 0, "startFrame": None, "lastFrame": 600000, "tempo": 120, "key": 0,
+                  "title": "Untitled", "composer": "Unknown", "noteThreshold": 50}
+FINISHED = ("done", "failed", "cancelled")
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               409: "Conflict", 411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+# Sends the progress of one job from a pool worker to the service through a Manager queue
+# Sends at most one event per interval seconds so long videos don't flood the queue
+class ProgressReporter:
+    def __init__(self, events, jobId, firstFrame, interval=0.25):
+        self.events = events
+        self.jobId = jobId
+        self.firstFrame = firstFrame
+        self.interval = interval
+        self.lastReport = 0
+
+    def __call__(self, timestamp, endFrame):
+        now = time.monotonic()
+        if now - self.lastReport >= self.interval:
+            self.lastReport = now
+            length = endFrame - self.firstFrame
+            fraction = (timestamp - self.firstFrame)/length if length>0 else 0
+            self.events.put((self.jobId, "progress", min(1.0, max(0.0, fraction))))
+
+# Transcribes one job in a pool worker, returns the (errorMessage, tempo) tuple of main
+# Jobs cancelled while waiting in the pool's call queue are skipped
+def RunJob(jobId, videoPath, outputName, parameters, events, cancel):
+    if cancel.is_set():
+        return (repr(Exception("Transcription cancelled")), None)
+    events.put((jobId, "running", 0.0))
+    startFrame = parameters["startFrame"] if parameters["startFrame"] is not None else parameters["keyFrame"]
+    reporter = ProgressReporter(events, jobId, max(parameters["keyFrame"], startFrame))
+    return main(videoPath, outputName, parameters["keyFrame"], startFrame, parameters["lastFrame"],
+                parameters["tempo"], parameters["key"], parameters["title"], parameters["composer"],
+                parameters["noteThreshold"], progress=reporter, cancel=cancel)
+
+# Reads the query parameters of POST /jobs, numeric parameters are converted like a batch manifest
+def ReadParameters(query):
+    parameters = dict(JOB_PARAMETERS)
+    for name, values in parse_qs(query).items():
+        if name not in parameters:
+            raise ValueError("Unknown parameter "+name)
+        parameters[name] = values[-1] if name in ("title","composer") else Number(values[-1])
+    return parameters
+
+# State of one transcription job, updated on the event loop
+# updated is set and replaced every time the job changes, so listeners wait on the event they saw last
+class Job:
+    def __init__(self, jobId, folder):
+        self.id = jobId
+        self.status = "receiving"
+        self.progress = 0.0
+        self.errorMessage = None
+        self.tempo = None
+        self.videoPath = os.path.join(folder, jobId+".video")
+        self.outputName = os.path.join(folder, jobId)
+        self.cancel = None # Manager event checked by process
+        self.cancelled = False # Set on the event loop, Manager calls block
+        self.work = None # Pool future, can only be cancelled while the job waits in the pool
+        self.future = None # Event loop future of work
+        self.updated = asyncio.Event()
+
+    def Notify(self):
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    def Status(self):
+        return {"id": self.id, "status": self.status, "progress": round(self.progress, 4),
+                "errorMessage": self.errorMessage, "tempo": self.tempo}
+
+# Accepts uploads on the event loop and runs at most workers transcriptions at once in a process pool
+# maxJobs bounds the jobs that are queued or running, further submissions get 503 until one finishes
+# expiry is how long (seconds) a finished job and its score are kept
+class TranscriptionService:
+    def __init__(self, folder, workers=2, maxJobs=64, maxUpload=2**31, expiry=3600):
+        self.folder = folder
+        self.workers = workers
+        self.maxJobs = maxJobs
+        self.maxUpload = maxUpload
+        self.expiry = expiry
+        self.jobs = {}
+        self.active = 0
+
+    # Runs the service until it is cancelled
+    async def Serve(self, host="127.0.0.1", port=8000):
+        os.makedirs(self.folder, exist_ok=True)
+        self.loop = asyncio.get_running_loop()
+        self.manager = multiprocessing.Manager()
+        self.events = self.manager.Queue() # Progress events from the pool workers
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        pump = threading.Thread(target=self.PumpEvents, daemon=True)
+        pump.start()
+        try:
+            server = await asyncio.start_server(self.Handle, host, port)
+            print("Serving on", host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            for job in self.jobs.values():
+                if job.cancel is not None:
+                    job.cancel.set()
+            self.pool.shutdown(cancel_futures=True)
+            self.events.put(None)
+            pump.join()
+            self.manager.shutdown()
+
+    # Moves progress events from the Manager queue onto the event loop
+    def PumpEvents(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                break
+            self.loop.call_soon_threadsafe(self.Update, *event)
+
+    def Update(self, jobId, kind, progress):
+        job = self.jobs.get(jobId)
+        if job is None or job.status in FINISHED: # Events can arrive after the job finished
+            return
+        job.status = "running"
+        job.progress = progress
+        job.Notify()
+
+    # Replaces pool with a new process pool if it is still the one jobs are submitted to
+    # A pool whose worker died is broken for good, every job in it and every later submit fails
+    def ReplacePool(self, pool):
+        if pool is self.pool:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+            pool.shutdown(wait=False)
+
+    def Finish(self, job, future, pool):
+        self.active -= 1
+        if future.cancelled():
+            job.status = "cancelled"
+        else:
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                self.ReplacePool(pool)
+            job.errorMessage, job.tempo = (repr(error), None) if error is not None else future.result()
+            if job.cancelled:
+                job.status = "cancelled"
+            elif job.errorMessage:
+                job.status = "failed"
+            else:
+                job.status, job.progress = "done", 1.0
+        if os.path.exists(job.videoPath):
+            os.remove(job.videoPath)
+        job.Notify()
+        self.loop.call_later(self.expiry, self.Expire, job)
+
+    # Forgets a finished job and removes its score
+    def Expire(self, job):
+        self.jobs.pop(job.id, None)
+        if os.path.exists(job.outputName+".musicxml"):
+            os.remove(job.outputName+".musicxml")
+
+    async def Handle(self, reader, writer):
+        try:
+            requestLine = (await reader.readline()).decode("latin-1")
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            method, target, _ = requestLine.split(" ", 2)
+            url = urlsplit(target)
+            path = url.path.strip("/").split("/")
+
+            if path[0] != "jobs" or len(path) > 3:
+                await self.Respond(writer, 404, {"error": "Unknown path"})
+            elif len(path) == 1:
+                if method != "POST":
+                    await self.Respond(writer, 405, {"error": "Use POST to submit a video"})
+                else:
+                    await self.Submit(reader, writer, url.query, headers)
+            elif path[1] not in self.jobs:
+                await self.Respond(writer, 404, {"error": "Unknown job"})
+            else:
+                job = self.jobs[path[1]]
+                action = path[2] if len(path) == 3 else None
+                if method == "GET" and action is None:
+                    await self.Respond(writer, 200, job.Status())
+                elif method == "DELETE" and action is None:
+                    await self.Cancel(job)
+                    await self.Respond(writer, 202, job.Status())
+                elif method == "GET" and action == "events":
+                    await self.SendEvents(writer, job)
+                elif method == "GET" and action == "result":
+                    await self.SendResult(writer, job)
+                else:
+                    await self.Respond(writer, 405, {"error": "Unsupported request"})
+        except (ValueError, KeyError) as error:
+            await self.Respond(writer, 400, {"error": repr(error)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # Streams the upload to disk and queues the job without waiting for the pool
+    async def Submit(self, reader, writer, query, headers):
+        if "content-length" not in headers:
+            await self.Respond(writer, 411, {"error": "Content-Length is required"})
+            return
+        length = int(headers["content-length"])
+        if length > self.maxUpload:
+            await self.Respond(writer, 413, {"error": "Video is larger than "+str(self.maxUpload)+" bytes"})
+            return
+        if self.active >= self.maxJobs:
+            await self.Respond(writer, 503, {"error": "Too many jobs, try again later"})
+            return
+        parameters = ReadParameters(query)
+
+        job = Job(uuid.uuid4().hex, self.folder)
+        self.jobs[job.id] = job
+        self.active += 1
+        try:
+            with open(job.videoPath, "wb") as video:
+                remaining = length
+                while remaining > 0:
+                    chunk = await reader.read(min(remaining, 1<<16))
+                    if not chunk:
+                        raise ConnectionError("Upload ended early")
+                    video.write(chunk)
+                    remaining -= len(chunk)
+            job.cancel = await self.loop.run_in_executor(None, self.manager.Event) # Manager calls block
+        except BaseException:
+            del self.jobs[job.id]
+            self.active -= 1
+            if os.path.exists(job.videoPath):
+                os.remove(job.videoPath)
+            raise
+
+        job.status = "queued"
+        for attempt in range(2): # A pool broken since the last job finished is replaced and the job retried once
+            pool = self.pool
+            try:
+                job.work = pool.submit(RunJob, job.id, job.videoPath, job.outputName, parameters, self.events, job.cancel)
+                break
+            except BrokenProcessPool:
+                self.ReplacePool(pool)
+        if job.work is None:
+            del self.jobs[job.id]
+            self.active -= 1
+            os.remove(job.videoPath)
+            await self.Respond(writer, 500, {"error": "Transcription workers keep failing, try again later"})
+            return
+        job.future = asyncio.wrap_future(job.work)
+        if job.cancelled: # Cancelled while uploading
+            await self.loop.run_in_executor(None, job.cancel.set)
+            job.work.cancel()
+        job.future.add_done_callback(lambda future: self.Finish(job, future, pool))
+        await self.Respond(writer, 202, job.Status())
+
+    # Queued jobs are dropped from the pool, running jobs stop at their next frame
+    # A running job finishes (and stops counting against maxJobs) once its worker returns
+    async def Cancel(self, job):
+        if job.status in FINISHED or job.cancelled:
+            return
+        job.cancelled = True
+        if job.work is None: # Still uploading, Submit cancels it once queued
+            return
+        await self.loop.run_in_executor(None, job.cancel.set)
+        job.work.cancel() # Only succeeds while the job waits in the pool
+
+    async def SendEvents(self, writer, job):
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                      "Cache-Control: no-cache\r\nConnection: close\r\n\r\n").encode("latin-1"))
+        while True:
+            updated = job.updated
+            writer.write(("data: "+json.dumps(job.Status())+"\n\n").encode("utf-8"))
+            await writer.drain()
+            if job.status in FINISHED:
+                break
+            await updated.wait()
+
+    async def SendResult(self, writer, job):
+        if job.status != "done":
+            await self.Respond(writer, 409, {"error": "Job is "+job.status})
+            return
+        with open(job.outputName+".musicxml", "rb") as score:
+            body = score.read()
+        await self.Respond(writer, 200, body, "application/vnd.recordare.musicxml+xml",
+                           {"Content-Disposition": 'attachment; filename="'+job.id+'.musicxml"'})
+
+    async def Respond(self, writer, status, body, contentType="application/json", headers={}):
+        if contentType == "application/json":
+            body = json.dumps(body).encode("utf-8")
+        head = "HTTP/1.1 "+str(status)+" "+STATUS_TEXT[status]+"\r\n"
+        head += "Content-Type: "+contentType+"\r\nContent-Length: "+str(len(body))+"\r\nConnection: close\r\n"
+        for name, value in headers.items():
+            head += name+": "+value+"\r\n"
+        writer.write(head.encode("latin-1")+b"\r\n"+body)
+        await writer.drain()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local video transcription service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="Videos transcribed at once")
+    parser.add_argument("--max-jobs", type=int, default=64, help="Queued and running jobs before submissions are refused")
+    parser.add_argument("--folder", default="service_jobs", help="Folder for uploads and results")
+    parser.add_argument("--expiry", type=float, default=3600, help="Seconds finished jobs and their scores are kept")
+    arguments = parser.parse_args()
+
+    service = TranscriptionService(arguments.folder, arguments.workers, arguments.max_jobs, expiry=arguments.expiry)
+    try:
+        asyncio.run(service.Serve(arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass